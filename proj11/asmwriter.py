@@ -0,0 +1,42 @@
+import os
+import sys
+
+# p8.py, the VM translator of project 8, is in its own directory next to this project
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proj8_working_tmp"))
+from p8 import CodeWriter, Parser, loop_commands, parse_command
+
+# Translates the VM code of a whole program into one Hack assembly file with p8.py's CodeWriter
+# The commands of each class come as the (opcode, args...) tuples of VMWriter.commands, they are never written as
+# VM code and parsed again
+class AsmWriter:
+    # output is the path of the .asm file or any text stream, options are passed on to the CodeWriter
+    def __init__(self, output, **options):
+        if isinstance(output, str):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        self.code_writer = CodeWriter(output, **options)
+        # Bootstrap code like p8.py writes it, sets SP and calls Sys.init
+        self.code_writer.comment("Bootstrap Code")
+        self.code_writer.write_init()
+
+    # Commands of one class, its statics are named after the class like p8.py names them after the .vm file
+    def write_commands(self, commands: list):
+        for command in commands:
+            if command[0] == "function":
+                self.code_writer.set_file_name(command[1].partition(".")[0])
+                break
+        # Comparisons in loops are told apart like p8.py does for a parsed file
+        loops = loop_commands([parse_command(command) for command in commands])
+        for (i, command) in enumerate(commands):
+            self.code_writer.write_command(command, i in loops)
+
+    # A .vm file that is not compiled from a class of the program, e.g. one of the OS
+    def write_vm_file(self, path: str):
+        self.code_writer.set_file_name(os.path.basename(path)[:-3])
+        parser = Parser(path)
+        while parser.hasMoreCommands():
+            parser.advance()
+            self.code_writer.comment(parser.current_command)
+            self.code_writer.write_instruction(*parser.instruction, parser.inLoop())
+
+    def close(self):
+        self.code_writer.close()
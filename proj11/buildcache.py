@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+
+CACHE_FILE_NAME = ".jackcache"
+
+# Modules whose code decides what the compiler outputs, changing any of them invalidates every cached class
+compiler_modules = ("main.py", "compengine.py", "tokenizer.py", "language.py", "symboltable.py", "vmwriter.py", "xmlwriter.py", "peephole.py", "expression.py", "syntaxtree.py", "jackparser.py", "controlflow.py", "wholeprogram.py", "inliner.py", "stackmodel.py", "asmwriter.py", "profiler.py")
+
+# Hash of the compiler's own code and the options that change its output
+def compiler_fingerprint(options) -> str:
+    fingerprint = hashlib.sha256()
+    compiler_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in compiler_modules:
+        with open(os.path.join(compiler_dir, module), "rb") as f:
+            fingerprint.update(f.read())
+    fingerprint.update(repr(options).encode())
+    return fingerprint.hexdigest()
+
+def source_hash(path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# Remembers which source (by content hash) every set of output files was compiled from
+# Stored as JSON in the output directory, next to the outputs it describes
+class BuildCache:
+    def __init__(self, outdir, source_dir, fingerprint):
+        self.path = os.path.join(outdir, CACHE_FILE_NAME)
+        self.source_dir = os.path.abspath(source_dir)
+        self.fingerprint = fingerprint
+        # file name -> {"hash": content hash, "outputs": [output paths]}
+        self.entries = {}
+        # False when there is no cache, or it belongs to another compiler version or source directory
+        self.valid = False
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    cache = json.load(f)
+                if cache["fingerprint"] == self.fingerprint and cache["source_dir"] == self.source_dir:
+                    self.entries = cache["files"]
+                    self.valid = True
+            except (ValueError, KeyError):
+                # Unreadable cache, everything is rebuilt
+                pass
+
+    def file_names(self) -> list:
+        return list(self.entries)
+
+    # True when the file was compiled from the same content and its outputs are still there
+    def is_fresh(self, file_name, content_hash) -> bool:
+        entry = self.entries.get(file_name)
+        if entry is None or entry["hash"] != content_hash:
+            return False
+        return all(os.path.exists(output) for output in entry["outputs"])
+
+    def update(self, file_name, content_hash, outputs):
+        self.entries[file_name] = {"hash": content_hash, "outputs": outputs}
+
+    # Drop a file from the cache along with the outputs compiled from it
+    def forget(self, file_name):
+        entry = self.entries.pop(file_name, None)
+        if entry is None:
+            return
+        for output in entry["outputs"]:
+            if os.path.exists(output):
+                os.remove(output)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        cache = {"fingerprint": self.fingerprint, "source_dir": self.source_dir, "files": self.entries}
+        # Write to a temporary file first so an interrupted build never leaves half a cache behind
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(cache, f)
+        os.replace(self.path + ".tmp", self.path)
@@ -1,9 +1,17 @@
-import os
-import xml.etree.ElementTree as xml_et
-from language import Keyword, TokenType, ValType
+from contextlib import nullcontext
 from tokenizer import JackTokenizer
 from vmwriter import VMWriter
-from symboltable import SymbolTable
+from symboltable import Symbol, SymbolTable
+from xmlwriter import XmlWriter, emit_class
+from jackparser import JackParser
+from syntaxtree import (ClassDec, SubroutineDec, LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement,
+                        Expression, IntegerConstant, StringConstant, KeywordConstant, VarRef, ArrayRef,
+                        SubroutineCall, ParenExpression, UnaryOp)
+import peephole
+import controlflow
+import stackmodel
+from wholeprogram import vm_size
+import expression
 
 var_segment_type = {
     "var": "local",
@@ -12,624 +20,348 @@ var_segment_type = {
     "static": "static"
 }
 
+# VM operation of each binary operator in an expression
+binary_operations = {
+    "+": "add",
+    "-": "sub",
+    "*": "multiply",
+    "/": "divide",
+    "&": "and",
+    "|": "or",
+    "<": "lt",
+    ">": "gt",
+    "=": "eq"
+}
+
+# Compiles a class in passes: JackParser builds the syntax tree, emit_class writes it as the parse tree XML
+# and the compile_* methods below generate its VM code
 class CompilationEngine:
-    def __init__(self, input_file_path, output_xml_file_path, output_vm_file_path):
+    def __init__(self, input_file_path, output_xml_file_path, output_vm_file_path, tokenizer=None, peephole_rules=(), fold_constants=False, pool_strings=False, control_flow=False, vm_extensions=False, profile=None):
         self.input_path = input_file_path
         self.output_xml_path = output_xml_file_path
-        # if os.path.exists(output_file_path):
-        #     os.remove(output_file_path)
-        self.tokenizer = JackTokenizer(input_file_path)
+        # The parse tree is only built when there is an .xml file to write it to
+        self.xml_writer = XmlWriter(output_xml_file_path) if output_xml_file_path is not None else None
+        # A tokenizer can be handed in, e.g. a JackTokenStream reading from stdin, otherwise the file is tokenized when
+        # it is parsed
+        self.tokenizer = tokenizer
         self.vm_writer = VMWriter(output_vm_file_path)
         self.symbol_table = SymbolTable()
         self.label_count = 0
         self.class_name = None
+        # Syntax tree of the class once it is parsed
+        self.class_dec = None
+        # Names of the peephole.rules run over the VM code before it is written
+        self.peephole_rules = peephole_rules
+        # Fold constant subexpressions and simplify identities in expressions
+        self.fold_constants = fold_constants
+        # Build every string constant once in Class.__strinit and keep it in a static instead of at each use
+        self.pool_strings = pool_strings
+        # Static index of each pooled string constant
+        self.string_pool = {}
+        # Static that is true once Class.__strinit ran, the pooled strings follow it
+        self.string_pool_flag = None
+        # Set when the subroutine being compiled pushes a pooled string
+        self.uses_string_pool = False
+        # Run controlflow.optimize over the VM code after the peephole rules
+        self.control_flow = control_flow
+        # Run stackmodel.optimize last, its dup, inc and dec commands are only understood by p8.py
+        self.vm_extensions = vm_extensions
+        # profiler.FileProfile the time of each phase and the counts of the class are recorded in, if any
+        self.profile = profile
+
+    # Context manager timing a phase of the profile, it does nothing when there is no profile
+    def phase(self, name: str):
+        return self.profile.phase(name) if self.profile is not None else nullcontext()
 
     def compile_class(self):
-        if self.tokenizer.has_more_tokens():
-            # Class declaration
-            self.class_root = xml_et.Element("class")
-            # Class keyword
-            CompilationEngine.__xml_token(self.class_root, "keyword", self.tokenizer.keyword()[1])
-            self.tokenizer.advance()
-
-            # Class identifier
-            CompilationEngine.__xml_token(self.class_root, "identifier", self.tokenizer.identifier())
-            self.class_name = self.tokenizer.identifier()
-            self.tokenizer.advance()
-            # Class symbol begin
-            CompilationEngine.__xml_token(self.class_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-
-            # Class declaration hierarchy Static -> Field -> Constructor -> Functions/Method(s)
-            # Compile static/field variables
-            while self.tokenizer.keyword()[0] == Keyword.STATIC or self.tokenizer.keyword()[0] == Keyword.FIELD:
-                self.compile_class_var_declaration()
-            while len(self.tokenizer.tokens) != 0 and self.tokenizer.token_type() != TokenType.SYMBOL and (self.tokenizer.keyword()[0] == Keyword.CONSTRUCTOR or self.tokenizer.keyword()[0] == Keyword.FUNCTION or self.tokenizer.keyword()[0] == Keyword.METHOD):
-                self.compile_subroutine()
-
-            # closing }
-            CompilationEngine.__xml_token(self.class_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-
-            if self.tokenizer.has_more_tokens():
-                raise Exception("More tokens still present")
-
-            self.output_tokenized_parsed_code()
-
-    def compile_class_var_declaration(self):
-        # Class var declaration
-        var_root = xml_et.SubElement(self.class_root, "classVarDec")
-
-        # var type
-        CompilationEngine.__xml_token(var_root, "keyword", self.tokenizer.keyword()[1])
-        var_kind = self.tokenizer.keyword()[1]
-        self.tokenizer.advance()
-
-        # Compiling the type and var name
-        if self.tokenizer.token_type() == TokenType.KEYWORD:
-            CompilationEngine.__xml_token(var_root, "keyword", self.tokenizer.keyword()[1])
-            var_type = self.tokenizer.keyword()[1]
-            self.tokenizer.advance()
-        # Data type
-        elif self.tokenizer.token_type() == TokenType.IDENTIFIER:
-            CompilationEngine.__xml_token(var_root, "identifier", self.tokenizer.identifier())
-            var_type = self.tokenizer.identifier()
-            self.tokenizer.advance()
-
-        # var identifier
-        CompilationEngine.__xml_token(var_root, "identifier", self.tokenizer.identifier())
-        var_name = self.tokenizer.identifier()
-        self.tokenizer.advance()
-
-        self.symbol_table.define(var_name, var_type, var_kind)
-
-        # Multiple variables defined in one line
-        while self.tokenizer.symbol() == ",":
-            CompilationEngine.__xml_token(var_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-            CompilationEngine.__xml_token(var_root, "identifier", self.tokenizer.identifier())
-            var_name = self.tokenizer.identifier()
-            self.tokenizer.advance()
-            self.symbol_table.define(var_name, var_type, var_kind)
-
-        # closing symbol ;
-        CompilationEngine.__xml_token(var_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
-    def compile_subroutine(self):
-        # Subroutine declaration
-        subroutine_root = xml_et.SubElement(self.class_root, "subroutineDec")
+        self.parse_class()
+        self.compile_class_dec(self.class_dec)
+
+    # Build the syntax tree of the class, and its parse tree XML if there is a file for it
+    def parse_class(self):
+        with self.phase("lex"):
+            if self.tokenizer is None:
+                self.tokenizer = JackTokenizer(self.input_path)
+        with self.phase("parse"):
+            self.class_dec = JackParser(self.tokenizer).parse_class()
+        if self.profile is not None:
+            # The parser reads every token of the file
+            self.profile.tokens = self.tokenizer.position
+        if self.xml_writer is not None:
+            with self.phase("xml"):
+                emit_class(self.class_dec, self.xml_writer)
+
+    # subroutines are the full names (Class.name) of the subroutines to compile, None compiles all of them
+    def compile_class_dec(self, class_dec: ClassDec, subroutines: set | None = None):
+        with self.phase("codegen"):
+            self.class_name = class_dec.name
+            for class_var_dec in class_dec.class_var_decs:
+                for var_name in class_var_dec.names:
+                    self.symbol_table.define(var_name, class_var_dec.type, class_var_dec.kind)
+            self.string_pool_flag = self.symbol_table.var_count("static")
+            for subroutine in class_dec.subroutines:
+                if subroutines is None or f"{self.class_name}.{subroutine.name}" in subroutines:
+                    self.compile_subroutine(subroutine)
+            if len(self.string_pool) != 0:
+                self.compile_string_init()
+
+    def compile_subroutine(self, subroutine: SubroutineDec):
         self.symbol_table.start_subroutine()
-        # Subroutine keyword
-        CompilationEngine.__xml_token(subroutine_root, "keyword", self.tokenizer.keyword()[1])
-        subroutine_type = self.tokenizer.keyword()[1]
-        self.tokenizer.advance()
-
-        # Subroutine return type
-        if self.tokenizer.token_type() == TokenType.KEYWORD:
-            CompilationEngine.__xml_token(subroutine_root, "keyword", self.tokenizer.keyword()[1])
-            self.tokenizer.advance()
-        # Subrouting ..
-        elif self.tokenizer.token_type() == TokenType.IDENTIFIER:
-            CompilationEngine.__xml_token(subroutine_root, "identifier", self.tokenizer.identifier())
-            self.tokenizer.advance()
-
-        # Subroutine identifier
-        CompilationEngine.__xml_token(subroutine_root, "identifier", self.tokenizer.identifier())
-        subroutine_name = self.tokenizer.identifier()
-        self.tokenizer.advance()
-
         # SYMBOL_TABLE: METHOD
-        if subroutine_type == "method":
+        if subroutine.kind == "method":
             self.symbol_table.define("this", self.class_name, "arg")
-
-        # Parameters
-        # symbol begin (
-        CompilationEngine.__xml_token(subroutine_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-        # params
-        self.compile_parameter_list(subroutine_root)
-        # symbol end )
-        CompilationEngine.__xml_token(subroutine_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
-        # Subroutine body
-        subroutine_body = xml_et.SubElement(subroutine_root, "subroutineBody")
-        # starting symbol {
-        CompilationEngine.__xml_token(subroutine_body, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-        # vars
+        for parameter in subroutine.parameters:
+            self.symbol_table.define(parameter.name, parameter.type, "arg")
         local_c = 0
-        while self.tokenizer.keyword()[1] == "var":
-            local_c += self.compile_var_dec(subroutine_body)
+        for var_dec in subroutine.var_decs:
+            for var_name in var_dec.names:
+                self.symbol_table.define(var_name, var_dec.type, "var")
+            local_c += len(var_dec.names)
+
         # VM_OUT: Function
-        self.vm_writer.write_function(self.class_name, subroutine_name, local_c)
+        self.vm_writer.write_function(self.class_name, subroutine.name, local_c)
         # VM_OUT: Constructor
-        if subroutine_type == "constructor":
+        if subroutine.kind == "constructor":
             self.vm_writer.write_push("constant", self.symbol_table.var_count("field"))
             self.vm_writer.write_call("Memory", "alloc", 1)
             self.vm_writer.write_pop("pointer", 0)
         # VM_OUT: METHOD
-        if subroutine_type == "method":
+        if subroutine.kind == "method":
             self.vm_writer.write_push("argument", 0)
             self.vm_writer.write_pop("pointer", 0)
 
-        # statements
-        self.compile_statements(subroutine_body)
-        # ending symbol }
-        CompilationEngine.__xml_token(subroutine_body, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
-    def compile_parameter_list(self, function_root) -> int:
-        # Parameter declaration
-        params_root = xml_et.SubElement(function_root, "parameterList")
-
-        # Build parameters
-        while self.tokenizer.token_type() != TokenType.SYMBOL:
-            # Keyword to define the type
-            if self.tokenizer.token_type() == TokenType.KEYWORD:
-                CompilationEngine.__xml_token(params_root, "keyword", self.tokenizer.keyword()[1])
-                param_type = self.tokenizer.keyword()[1]
-                self.tokenizer.advance()
-            # Parameter identifier
-            elif self.tokenizer.token_type() == TokenType.IDENTIFIER:
-                CompilationEngine.__xml_token(params_root, "identifier", self.tokenizer.identifier())
-                param_type = self.tokenizer.identifier()
-                self.tokenizer.advance()
-                
-            CompilationEngine.__xml_token(params_root, "identifier", self.tokenizer.identifier())
-            param_ident = self.tokenizer.identifier()
-            self.tokenizer.advance()
-
-            self.symbol_table.define(param_ident, param_type, "arg")
-
-            if self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() == ",":
-                CompilationEngine.__xml_token(params_root, "symbol", self.tokenizer.symbol())
-                self.tokenizer.advance()
-            
-    def compile_var_dec(self, root):
-        var_root = xml_et.SubElement(root, "varDec")
-
-        var_c = 1
-
-        # var keyword
-        CompilationEngine.__xml_token(var_root, "keyword", self.tokenizer.keyword()[1])
-        var_type = self.tokenizer.keyword()[1]
-        self.tokenizer.advance()
-
-        # Compiling the type and var name
-        if self.tokenizer.token_type() == TokenType.KEYWORD:
-            CompilationEngine.__xml_token(var_root, "keyword", self.tokenizer.keyword()[1])
-            var_type = self.tokenizer.keyword()[1]
-            self.tokenizer.advance()
-        # Data type
-        elif self.tokenizer.token_type() == TokenType.IDENTIFIER:
-            CompilationEngine.__xml_token(var_root, "identifier", self.tokenizer.identifier())
-            var_type = self.tokenizer.identifier()
-            self.tokenizer.advance()
-
-        # var identifier
-        CompilationEngine.__xml_token(var_root, "identifier", self.tokenizer.identifier())
-        var_name = self.tokenizer.identifier()
-        self.tokenizer.advance()
-        self.symbol_table.define(var_name, var_type, "var")
-
-        # Multiple variables defined in one line
-        while self.tokenizer.symbol() == ",":
-            CompilationEngine.__xml_token(var_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-            CompilationEngine.__xml_token(var_root, "identifier", self.tokenizer.identifier())
-            var_name = self.tokenizer.identifier()
-            self.tokenizer.advance()
-            self.symbol_table.define(var_name, var_type, "var")
-            var_c += 1
-
-        # closing symbol ;
-        CompilationEngine.__xml_token(var_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
-        return var_c
-
-    def compile_statements(self, root):
-        # Statements declaration
-        statement_root = xml_et.SubElement(root, "statements")
-        # Statements
-        while self.tokenizer.token_type() == TokenType.KEYWORD:
-            match self.tokenizer.keyword()[0]:
-                case Keyword.LET:
-                    self.compile_let(statement_root)
-                case Keyword.IF: 
-                    self.compile_if(statement_root)
-                case Keyword.DO:
-                    self.compile_do(statement_root)
-                case Keyword.WHILE:
-                    self.compile_while(statement_root)
-                case Keyword.RETURN:
-                    self.compile_return(statement_root)
-                case _:
-                    raise Exception("Invalid keyword in compile_statements match-case")
-
-    def compile_let(self, root):
-        let_statement_root = xml_et.SubElement(root, "letStatement")
-
-        # let keyword
-        CompilationEngine.__xml_token(let_statement_root, "keyword", self.tokenizer.keyword()[1])
-        self.tokenizer.advance()
-
-        # identifier
-        CompilationEngine.__xml_token(let_statement_root, "identifier", self.tokenizer.identifier())
-        var_name = self.tokenizer.identifier()
-        self.tokenizer.advance()
-
-        # array declaration
-        is_array = False
-        if self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() == "[":
-            is_array = True
-            # starting symbol [
-            CompilationEngine.__xml_token(let_statement_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-            # evaluate expressions inside the array
-            self.compile_expression(let_statement_root)
-            # ending symbol ]
-            CompilationEngine.__xml_token(let_statement_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-
-            self.push_var(var_name)
-            self.vm_writer.write_arithmetic("add")
+        body_start = len(self.vm_writer.commands)
+        self.uses_string_pool = False
+        self.compile_statements(subroutine.statements)
+        if self.uses_string_pool:
+            self.insert_string_init_guard(body_start)
 
-        # equal symbol
-        CompilationEngine.__xml_token(let_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
+    # VM_OUT: Class.__strinit, builds every pooled string and sets the flag
+    def compile_string_init(self):
+        self.vm_writer.write_function(self.class_name, "__strinit", 0)
+        self.vm_writer.write_int(0)
+        self.vm_writer.write_arithmetic("not")
+        self.vm_writer.write_pop("static", self.string_pool_flag)
+        for (string, index) in self.string_pool.items():
+            self.vm_writer.write_string(string)
+            self.vm_writer.write_pop("static", index)
+        self.vm_writer.write_int(0)
+        self.vm_writer.write_return()
 
-        # statement
-        self.compile_expression(let_statement_root)
-        
-        if is_array:
+    # Run Class.__strinit before the body at position if it has not run yet
+    def insert_string_init_guard(self, position: int):
+        guard_start = len(self.vm_writer.commands)
+        init_done_lbl = self.__hash_label()
+        self.vm_writer.write_push("static", self.string_pool_flag)
+        self.vm_writer.write_if(init_done_lbl)
+        self.vm_writer.write_call(self.class_name, "__strinit", 0)
+        self.vm_writer.write_pop("temp", 0)
+        self.vm_writer.write_label(init_done_lbl)
+        guard = self.vm_writer.commands[guard_start:]
+        del self.vm_writer.commands[guard_start:]
+        self.vm_writer.commands[position:position] = guard
+
+    def compile_statements(self, statements: list):
+        for statement in statements:
+            match statement:
+                case LetStatement():
+                    self.compile_let(statement)
+                case IfStatement():
+                    self.compile_if(statement)
+                case DoStatement():
+                    self.compile_do(statement)
+                case WhileStatement():
+                    self.compile_while(statement)
+                case ReturnStatement():
+                    self.compile_return(statement)
+
+    def compile_let(self, statement: LetStatement):
+        if statement.index is not None:
+            # address of the array element
+            self.compile_expression(statement.index)
+            self.push_var(statement.name)
+            self.vm_writer.write_arithmetic("add")
+
+            self.compile_expression(statement.value)
             self.vm_writer.write_pop("temp", 0)
             self.vm_writer.write_pop("pointer", 1)
             self.vm_writer.write_push("temp", 0)
             self.vm_writer.write_pop("that", 0)
         else:
-            let_kind = self.symbol_table.kind_of(var_name)
-            let_idx = self.symbol_table.index_of(var_name)
-            self.vm_writer.write_pop(var_segment_type[let_kind] if let_kind != None else "local", let_idx)
-
-        # closing ;
-        CompilationEngine.__xml_token(let_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
-    def compile_do(self, root):
-        do_statement_root = xml_et.SubElement(root, "doStatement")
-        arg_c = 0
-
-        # do keyword
-        CompilationEngine.__xml_token(do_statement_root, "keyword", self.tokenizer.keyword()[1])
-        self.tokenizer.advance()
-
-        # subroutine to call
-        CompilationEngine.__xml_token(do_statement_root, "identifier", self.tokenizer.identifier())
-        first_ident = self.tokenizer.identifier()
-        self.tokenizer.advance()
-
-        # dot operator
-        if self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() == ".":
-            CompilationEngine.__xml_token(do_statement_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-            CompilationEngine.__xml_token(do_statement_root, "identifier", self.tokenizer.identifier())
-            inner_ident = self.tokenizer.identifier()
-            self.tokenizer.advance()
-
-            do_type = self.symbol_table.type_of(first_ident)
-            if do_type != None:
-                self.push_var(first_ident)
-                full_func_name = (do_type, inner_ident)
-                arg_c = 1
+            self.compile_expression(statement.value)
+            let_symbol = self.symbol_table.lookup(statement.name)
+            if let_symbol is not None:
+                self.vm_writer.write_pop(var_segment_type[let_symbol.kind], let_symbol.index)
             else:
-                full_func_name = (first_ident, inner_ident)
-        else:
-            full_func_name = (self.class_name, first_ident)
-            self.vm_writer.write_push("pointer", 0)
-            arg_c = 1
+                self.vm_writer.write_pop("local", None)
 
-        # opening symbol (
-        CompilationEngine.__xml_token(do_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-        # expression
-        arg_c += self.compile_expression_list(do_statement_root)
-        # closing symbol )
-        CompilationEngine.__xml_token(do_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
-        # ending symbol ;
-        CompilationEngine.__xml_token(do_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
-        self.vm_writer.write_call(full_func_name[0], full_func_name[1], arg_c)
+    def compile_do(self, statement: DoStatement):
+        self.compile_call(statement.call)
         self.vm_writer.write_pop("temp", 0)
 
-    def compile_while(self, root):
-        while_statement_root = xml_et.SubElement(root, "whileStatement")
-        # while_id = self.__hash_label("while")
-        # while_start_lbl = while_id + ".start"
-        # while_end_lbl = while_id + ".end"
+    def compile_while(self, statement: WhileStatement):
         while_start_lbl = self.__hash_label()
         while_end_lbl = self.__hash_label()
 
-        # while keyword
-        CompilationEngine.__xml_token(while_statement_root, "keyword", self.tokenizer.keyword()[1])
-        self.tokenizer.advance()
         self.vm_writer.write_label(while_start_lbl)
-
-        # start symbol (
-        CompilationEngine.__xml_token(while_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-        # expression eval
-        self.compile_expression(while_statement_root)
-        # end symbol )
-        CompilationEngine.__xml_token(while_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
+        self.compile_expression(statement.condition)
         self.vm_writer.write_arithmetic("not")
         self.vm_writer.write_if(while_end_lbl)
-        
-        # beginning {
-        CompilationEngine.__xml_token(while_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
-        # statements
-        self.compile_statements(while_statement_root)
-
-        # ending }
-        CompilationEngine.__xml_token(while_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-        
+
+        self.compile_statements(statement.statements)
+
         self.vm_writer.write_goto(while_start_lbl)
         self.vm_writer.write_label(while_end_lbl)
 
-    def compile_if(self, root):
-        if_statement_root = xml_et.SubElement(root, "ifStatement")
-        # if_id = self.__hash_label("if")
-        # if_true_lbl = if_id + ".start"
-        # if_end_lbl = if_id + ".end"
+    def compile_if(self, statement: IfStatement):
         if_true_lbl = self.__hash_label()
         if_end_lbl = self.__hash_label()
 
-        # if keyword
-        CompilationEngine.__xml_token(if_statement_root, "keyword", self.tokenizer.keyword()[1])
-        self.tokenizer.advance()
-
-        # starting symbol (
-        CompilationEngine.__xml_token(if_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance() 
-        # expression eval
-        self.compile_expression(if_statement_root)
-        # ending symbol )
-        CompilationEngine.__xml_token(if_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-
+        self.compile_expression(statement.condition)
         self.vm_writer.write_arithmetic("not")
         self.vm_writer.write_if(if_end_lbl)
 
-        # starting symbol {
-        CompilationEngine.__xml_token(if_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
-        # statements
-        self.compile_statements(if_statement_root)
-        # ending symbol }
-        CompilationEngine.__xml_token(if_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
+        self.compile_statements(statement.statements)
         self.vm_writer.write_goto(if_true_lbl)
         self.vm_writer.write_label(if_end_lbl)
 
-        if self.tokenizer.token_type() == TokenType.KEYWORD and self.tokenizer.keyword()[0] == Keyword.ELSE:
-            # else keyword
-            CompilationEngine.__xml_token(if_statement_root, "keyword", self.tokenizer.keyword()[1])
-            self.tokenizer.advance()
-            # starting symbol {
-            CompilationEngine.__xml_token(if_statement_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-            # statements
-            self.compile_statements(if_statement_root)
-            # ending symbol }
-            CompilationEngine.__xml_token(if_statement_root, "symbol", self.tokenizer.symbol())
-            self.tokenizer.advance()
-        
-        self.vm_writer.write_label(if_true_lbl)
-
-    def compile_return(self, root):
-        return_statement_root = xml_et.SubElement(root, "returnStatement")
+        if statement.else_statements is not None:
+            self.compile_statements(statement.else_statements)
 
-        # return keyword
-        CompilationEngine.__xml_token(return_statement_root, "keyword", self.tokenizer.keyword()[1])
-        self.tokenizer.advance()
+        self.vm_writer.write_label(if_true_lbl)
 
-        # additional expressions
-        if self.tokenizer.token_type() != TokenType.SYMBOL or self.tokenizer.symbol() != ";":
-            self.compile_expression(return_statement_root)
+    def compile_return(self, statement: ReturnStatement):
+        if statement.value is not None:
+            self.compile_expression(statement.value)
         else:
             self.vm_writer.write_int(0)
+        self.vm_writer.write_return()
 
-        # ending ;
-        CompilationEngine.__xml_token(return_statement_root, "symbol", self.tokenizer.symbol())
-        self.tokenizer.advance()
+    def compile_call(self, call: SubroutineCall):
+        if call.receiver is None:
+            # Method of this class
+            full_func_name = (self.class_name, call.name)
+            self.vm_writer.write_push("pointer", 0)
+            arg_c = 1
+        else:
+            receiver_symbol = self.symbol_table.lookup(call.receiver)
+            if receiver_symbol is not None:
+                # Method of the object in a variable
+                self.push_symbol(receiver_symbol)
+                full_func_name = (receiver_symbol.type, call.name)
+                arg_c = 1
+            else:
+                # Function or constructor of a class
+                full_func_name = (call.receiver, call.name)
+                arg_c = 0
 
-        self.vm_writer.write_return()
+        for argument in call.arguments:
+            self.compile_expression(argument)
+        arg_c += len(call.arguments)
 
-    def compile_expression(self, root):
-        expression_root = xml_et.SubElement(root, "expression")
-
-        self.compile_term(expression_root)
-        while self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() in ["+", "-", "*", "/", "&", "|", "<", ">", "="]:
-            CompilationEngine.__xml_token(expression_root, "symbol", self.tokenizer.symbol())
-            operation = self.tokenizer.symbol()
-            self.tokenizer.advance()
-            self.compile_term(expression_root)
-
-            match operation:
-                case "+":
-                    self.vm_writer.write_arithmetic("add")
-                case "-":
-                    self.vm_writer.write_arithmetic("sub")
-                case "*":
-                    self.vm_writer.write_call("Math", "multiply", 2)
-                case "/":
-                    self.vm_writer.write_call("Math", "divide", 2)
-                case "&":
-                    self.vm_writer.write_arithmetic("and")
-                case "|":
-                    self.vm_writer.write_arithmetic("or")
-                case "<":
-                    self.vm_writer.write_arithmetic("lt")
-                case ">":
-                    self.vm_writer.write_arithmetic("gt")
-                case "=":
-                    self.vm_writer.write_arithmetic("eq")
-
-    def compile_term(self, root):
-        term_root = xml_et.SubElement(root, "term")
-
-        match self.tokenizer.token_type():
-            case TokenType.KEYWORD:
-                CompilationEngine.__xml_token(term_root, "keyword", self.tokenizer.keyword()[1])
-                if self.tokenizer.keyword()[1] == "this":
-                    self.vm_writer.write_push("pointer", 0)
+        self.vm_writer.write_call(full_func_name[0], full_func_name[1], arg_c)
+
+    def compile_expression(self, node: Expression):
+        tree = self.expression_tree(node)
+        if self.fold_constants:
+            tree = expression.fold(tree)
+        expression.write(tree, self.vm_writer)
+
+    # Expression IR of an expression, only the terms that cannot be folded are compiled to VM code
+    def expression_tree(self, node: Expression):
+        terms = node.terms
+        tree = self.term_tree(terms[0])
+        for (op, term) in zip(node.ops, terms[1:]):
+            tree = expression.Binary(binary_operations[op], tree, self.term_tree(term))
+        return tree
+
+    def term_tree(self, term):
+        match term:
+            case IntegerConstant():
+                return expression.Constant(term.value)
+            case KeywordConstant():
+                if term.keyword == "true":
+                    return expression.Constant(-1)
+                elif term.keyword != "this":
+                    return expression.Constant(0)
+            case ParenExpression():
+                return self.expression_tree(term.expression)
+            case UnaryOp():
+                return expression.Unary("neg" if term.op == "-" else "not", self.term_tree(term.term))
+
+        # VM code the term writes is taken back out of the writer and kept in the IR
+        code_start = len(self.vm_writer.commands)
+        self.compile_term(term)
+        code = expression.Code(self.vm_writer.commands[code_start:])
+        del self.vm_writer.commands[code_start:]
+        return code
+
+    # VM code of the terms that are not part of the expression IR
+    def compile_term(self, term):
+        match term:
+            case KeywordConstant():
+                # this
+                self.vm_writer.write_push("pointer", 0)
+            case StringConstant():
+                if self.pool_strings:
+                    self.push_pooled_string(term.value)
                 else:
-                    if self.tokenizer.keyword()[1] == "true":
-                        self.vm_writer.write_int(1)
-                        self.vm_writer.write_arithmetic("neg")
-                    else:
-                        self.vm_writer.write_int(0)
-                self.tokenizer.advance()
-            case TokenType.INT_CONST:
-                CompilationEngine.__xml_token(term_root, "integerConstant", self.tokenizer.int_val())
-                self.vm_writer.write_int(self.tokenizer.int_val())
-                self.tokenizer.advance()
-            case TokenType.STRING_CONST:
-                CompilationEngine.__xml_token(term_root, "stringConstant", self.tokenizer.string_val())
-                self.vm_writer.write_string(self.tokenizer.string_val())
-                self.tokenizer.advance()
-            case TokenType.SYMBOL:
-                if self.tokenizer.symbol() == "(":
-                    CompilationEngine.__xml_token(term_root, "symbol", self.tokenizer.symbol())
-                    self.tokenizer.advance()
-                    self.compile_expression(term_root)
-                    CompilationEngine.__xml_token(term_root, "symbol", self.tokenizer.symbol())
-                    self.tokenizer.advance()
-                elif self.tokenizer.symbol() in ["~", "-"]:
-                    CompilationEngine.__xml_token(term_root, "symbol", self.tokenizer.symbol())
-                    sym = self.tokenizer.symbol()
-                    self.tokenizer.advance()
-                    self.compile_term(term_root)
-                    if sym == "-":
-                        self.vm_writer.write_arithmetic("neg")
-                    elif sym == "~":
-                        self.vm_writer.write_arithmetic("not")
-                    else:
-                        raise Exception("Unreachable code")
-            case _:
-                prev_val = self.tokenizer.curr_token()
-                prev_is_identifier = self.tokenizer.token_type() == TokenType.IDENTIFIER
-
-                self.tokenizer.advance()
-                if self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() == "[":
-                    # identifier
-                    CompilationEngine.__xml_token(term_root, "identifier", prev_val)
-                    # opening symbol [
-                    CompilationEngine.__xml_token(term_root, "symbol", self.tokenizer.symbol())
-                    self.tokenizer.advance()
-                    # eval expression in the brackets
-                    self.compile_expression(term_root)
-
-                    # TODO: fix
-                    self.push_var(prev_val)
-                    self.vm_writer.write_arithmetic("add")
-                    self.vm_writer.write_pop("pointer", 1)
-                    self.vm_writer.write_push("that", 0)
-
-                    # closing symbol ]
-                    CompilationEngine.__xml_token(term_root, "symbol", self.tokenizer.symbol())
-                    self.tokenizer.advance()
-                elif self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() == ".":
-                    # Class
-                    CompilationEngine.__xml_token(term_root, "identifier", prev_val) 
-                    # dot operator
-                    CompilationEngine.__xml_token(term_root, "symbol", self.tokenizer.symbol())
-                    self.tokenizer.advance()
-                    # Subroutine call
-                    CompilationEngine.__xml_token(term_root, "identifier", self.tokenizer.identifier())
-                    inner_ident = self.tokenizer.identifier()
-                    self.tokenizer.advance()
-
-                    CompilationEngine.__xml_token(term_root, "symbol", self.tokenizer.symbol())
-                    self.tokenizer.advance()
-
-                    arg_c = 0
-                    subroutine_type = self.symbol_table.type_of(prev_val)
-                    if subroutine_type != None:
-                        self.push_var(prev_val)
-                        full_func_name = (subroutine_type, inner_ident)
-                        arg_c = 1
-                    else:
-                        full_func_name = (prev_val, inner_ident)
-
-                    arg_c += self.compile_expression_list(term_root)
-
-                    CompilationEngine.__xml_token(term_root, "symbol", self.tokenizer.symbol())
-                    self.tokenizer.advance()
-
-                    self.vm_writer.write_call(full_func_name[0], full_func_name[1], arg_c)
-                    # self.vm_writer.write_pop("temp", 0)
-                elif prev_is_identifier:
-                    CompilationEngine.__xml_token(term_root, "identifier", prev_val) 
-                    self.push_var(prev_val)
-                elif self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() == "(":
-                    self.tokenizer.advance()
-
-    def compile_expression_list(self, root):
-        expression_list_root = xml_et.SubElement(root, "expressionList")
-
-        expr_c = 0
-        
-        if self.tokenizer.token_type() != TokenType.SYMBOL or (self.tokenizer.token_type() == TokenType.SYMBOL and  self.tokenizer.symbol() != ")"):
-            self.compile_expression(expression_list_root)
-            expr_c += 1
-            while self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() == ",":
-                CompilationEngine.__xml_token(expression_list_root, "symbol", self.tokenizer.symbol())
-                self.tokenizer.advance()
-                self.compile_expression(expression_list_root)
-                expr_c += 1
-        if self.tokenizer.symbol() == "(":
-            self.compile_expression_list(expression_list_root)
-            while self.tokenizer.token_type() == TokenType.SYMBOL and self.tokenizer.symbol() == ",":
-                CompilationEngine.__xml_token(expression_list_root, "symbol", self.tokenizer.symbol())
-                self.tokenizer.advance()
-                self.compile_expression(expression_list_root)
-
-        return expr_c
+                    self.vm_writer.write_string(term.value)
+            case VarRef():
+                self.push_var(term.name)
+            case ArrayRef():
+                self.compile_expression(term.index)
+                self.push_var(term.name)
+                self.vm_writer.write_arithmetic("add")
+                self.vm_writer.write_pop("pointer", 1)
+                self.vm_writer.write_push("that", 0)
+            case SubroutineCall():
+                self.compile_call(term)
+
+    def push_pooled_string(self, string: str):
+        index = self.string_pool.get(string)
+        if index is None:
+            index = self.string_pool_flag + 1 + len(self.string_pool)
+            self.string_pool[string] = index
+        self.vm_writer.write_push("static", index)
+        self.uses_string_pool = True
 
     def push_var(self, identifier: str):
-        kind = self.symbol_table.kind_of(identifier)
-        index = self.symbol_table.index_of(identifier)
-        self.vm_writer.write_push(var_segment_type[kind] if kind != None else "local", index)
+        self.push_symbol(self.symbol_table.lookup(identifier))
+
+    def push_symbol(self, symbol: Symbol | None):
+        if symbol is not None:
+            self.vm_writer.write_push(var_segment_type[symbol.kind], symbol.index)
+        else:
+            self.vm_writer.write_push("local", None)
 
     def output_tokenized_parsed_code(self):
-        tree = xml_et.ElementTree(self.class_root)
-        xml_et.indent(tree, space="\t", level = 0)
-        os.makedirs(os.path.dirname(self.output_xml_path), exist_ok=True)
-        tree.write(self.output_xml_path, encoding="utf-8", xml_declaration=False, short_empty_elements=False)
+        if self.xml_writer is not None:
+            with self.phase("xml"):
+                self.xml_writer.write_xml_file()
+
+    def optimize_vm_code(self):
+        with self.phase("optimize"):
+            self.vm_writer.commands = peephole.optimize(self.vm_writer.commands, self.peephole_rules)
+            if self.control_flow:
+                self.vm_writer.commands = controlflow.optimize(self.vm_writer.commands)
+            if self.vm_extensions:
+                self.vm_writer.commands = stackmodel.optimize(self.vm_writer.commands)
+
+    def write_vm_code(self):
+        with self.phase("write"):
+            self.vm_writer.write_vm_file()
+        if self.profile is not None:
+            self.profile.vm_commands = vm_size(self.vm_writer.commands)
 
     def output_vm_code(self):
-        self.vm_writer.write_vm_file()
+        self.optimize_vm_code()
+        self.write_vm_code()
 
-    def __xml_token(root, tag: str, value: str):
-        element = xml_et.SubElement(root, tag)
-        element.text = value
-        return element
-    
     # def __hash_label(self, label) -> str:
     def __hash_label(self) -> str:
         # label_to_hash = str(label + str(self.label_count))
         # hash_val = "{}_{}".format(label, str(hash(label_to_hash)))
         hash_val = "{}_{}".format(self.class_name, str(self.label_count))
         self.label_count += 1
-        return hash_val
\ No newline at end of file
+        return hash_val
@@ -0,0 +1,225 @@
+# Control flow optimization of the VM commands a CompilationEngine produced
+# Commands are the (opcode, args...) tuples of VMWriter.commands. Labels are unique within a class, so the commands of
+# a whole class are optimized at once
+
+# Number of values each opcode pops and pushes, call is handled on its own
+stack_effects = {
+    "push": (0, 1),
+    "pop": (1, 0),
+    "add": (2, 1),
+    "sub": (2, 1),
+    "and": (2, 1),
+    "or": (2, 1),
+    "eq": (2, 1),
+    "gt": (2, 1),
+    "lt": (2, 1),
+    "neg": (1, 1),
+    "not": (1, 1),
+    # VM extensions of stackmodel.py
+    "dup": (1, 2),
+    "inc": (1, 1),
+    "dec": (1, 1),
+}
+
+# Position of the first command computing the value on top of the stack after commands[end],
+# None when it is not computed by the straight-line code before it
+def value_start(commands, end: int) -> int | None:
+    missing = 1
+    for i in range(end, -1, -1):
+        command = commands[i]
+        if command[0] == "call":
+            (pops, pushes) = (command[2], 1)
+        elif command[0] in stack_effects:
+            (pops, pushes) = stack_effects[command[0]]
+        else:
+            return None
+        missing += pops - pushes
+        if missing == 0:
+            return i
+    return None
+
+# True when the value on top of the stack after commands[end] is always true (-1) or false (0)
+def is_boolean(commands, end: int) -> bool:
+    command = commands[end]
+    match command[0]:
+        case "eq" | "gt" | "lt":
+            # Comparisons always leave true or false
+            return True
+        case "push":
+            return command[1:] == ("constant", 0)
+        case "not":
+            return end > 0 and is_boolean(commands, end - 1)
+        case "neg":
+            # true compiles to push constant 1; neg
+            return end > 0 and commands[end - 1] == ("push", "constant", 1)
+        case "and" | "or":
+            right_start = value_start(commands, end - 1)
+            return right_start is not None and right_start > 0 and is_boolean(commands, end - 1) and is_boolean(commands, right_start - 1)
+    return False
+
+jump_opcodes = {"goto", "if-goto"}
+
+# Position of every label
+def label_positions(commands) -> dict:
+    return {command[1]: i for (i, command) in enumerate(commands) if command[0] == "label"}
+
+# A label named after base that is not in labels yet, it is added to them
+def new_label(base: str, labels) -> str:
+    label = base
+    n = 1
+    while label in labels:
+        n += 1
+        label = f"{base}{n}"
+    labels[label] = None
+    return label
+
+# Number of jumps to every label
+def label_references(commands) -> dict:
+    references = {}
+    for command in commands:
+        if command[0] in jump_opcodes:
+            references[command[1]] = references.get(command[1], 0) + 1
+    return references
+
+# goto L1 ... label L1; goto L2 -> goto L2, for if-goto as well
+def thread_jumps(commands):
+    positions = label_positions(commands)
+    threaded = []
+    for command in commands:
+        if command[0] in jump_opcodes:
+            target = command[1]
+            seen = {target}
+            while True:
+                i = positions[target] + 1
+                # Several labels can mark the same place
+                while i < len(commands) and commands[i][0] == "label":
+                    i += 1
+                if i == len(commands) or commands[i][0] != "goto" or commands[i][1] in seen:
+                    break
+                target = commands[i][1]
+                seen.add(target)
+            if target != command[1]:
+                command = (command[0], target)
+        threaded.append(command)
+    return threaded
+
+# Positions of the not; if-goto E and the label E of a loop starting with the label at start, None if there is none
+# label S; condition; not; if-goto E; body; goto S; label E, with a condition that is true or false
+def loop_at(commands, start: int, positions: dict, references: dict) -> tuple | None:
+    # Straight-line condition ending in not; if-goto E
+    branch = start + 1
+    while branch < len(commands) and (commands[branch][0] in stack_effects or commands[branch][0] == "call"):
+        branch += 1
+    if branch == len(commands) or commands[branch][0] != "if-goto" or commands[branch - 1][0] != "not" or branch - 2 <= start:
+        return None
+    end_label = commands[branch][1]
+    end = positions[end_label]
+    if end <= branch or commands[end - 1] != ("goto", commands[start][1]) or references[end_label] != 1:
+        return None
+    # if-goto jumps on any value but zero, so not only inverts true and false
+    if not is_boolean(commands, branch - 2):
+        return None
+    return (branch, end)
+
+# label S; condition; not; if-goto E; body; goto S; label E -> goto S; label S_loop; body; label S; condition; if-goto S_loop; label E
+# The condition is evaluated at the bottom of the loop, which saves the not and the goto of every iteration
+def rotate_loops(commands):
+    positions = label_positions(commands)
+    references = label_references(commands)
+
+    # Commands from first up to last with every loop in them rotated, loops inside loops included
+    def rotate(first: int, last: int) -> list:
+        rotated = []
+        i = first
+        while i < last:
+            loop = loop_at(commands, i, positions, references) if commands[i][0] == "label" else None
+            if loop is None:
+                rotated.append(commands[i])
+                i += 1
+                continue
+            (branch, end) = loop
+            start_label = commands[i]
+            body_label = new_label(start_label[1] + "_loop", positions)
+            rotated.extend([("goto", start_label[1]), ("label", body_label)])
+            rotated.extend(rotate(branch + 1, end - 1))
+            rotated.append(start_label)
+            rotated.extend(commands[i + 1:branch - 1])
+            rotated.append(("if-goto", body_label))
+            i = end
+        return rotated
+
+    return rotate(0, len(commands))
+
+# value; not; if-goto E -> value; if-goto E_true; goto E; label E_true when the value is true or false
+# The not is saved on both paths, goto E is threaded further when E is followed by a jump
+# Pairs of not before an if-goto cancel out for any value
+def invert_branches(commands):
+    labels = label_positions(commands)
+    inverted = []
+    for command in commands:
+        if command[0] != "if-goto" or len(inverted) == 0 or inverted[-1][0] != "not":
+            inverted.append(command)
+            continue
+        value_end = len(inverted) - 1
+        while value_end >= 0 and inverted[value_end][0] == "not":
+            value_end -= 1
+        negations = len(inverted) - 1 - value_end
+        if negations % 2 == 0:
+            del inverted[value_end + 1:]
+            inverted.append(command)
+        elif value_end >= 0 and is_boolean(inverted, value_end):
+            del inverted[value_end + 1:]
+            true_label = new_label(command[1] + "_true", labels)
+            inverted.extend([("if-goto", true_label), ("goto", command[1]), ("label", true_label)])
+        else:
+            del inverted[value_end + 2:]
+            inverted.append(command)
+    return inverted
+
+# goto L; label L -> label L, only labels may be in between
+# An if-goto to the next command still pops its condition, temp 0 is never live across a statement's jumps
+def remove_jumps_to_next(commands):
+    kept = []
+    for (i, command) in enumerate(commands):
+        if command[0] in jump_opcodes:
+            j = i + 1
+            while j < len(commands) and commands[j][0] == "label" and commands[j][1] != command[1]:
+                j += 1
+            if j < len(commands) and commands[j] == ("label", command[1]):
+                if command[0] == "if-goto":
+                    kept.append(("pop", "temp", 0))
+                continue
+        kept.append(command)
+    return kept
+
+# Remove the commands no path from the start of a function reaches
+def remove_unreachable(commands):
+    positions = label_positions(commands)
+    reachable = [False] * len(commands)
+    starts = [i for (i, command) in enumerate(commands) if command[0] == "function"]
+    while len(starts) != 0:
+        i = starts.pop()
+        # Follow the commands from i until a goto, return or a command that was already reached
+        while i < len(commands) and not reachable[i]:
+            reachable[i] = True
+            opcode = commands[i][0]
+            if opcode in jump_opcodes:
+                starts.append(positions[commands[i][1]])
+            if opcode == "goto" or opcode == "return":
+                break
+            i += 1
+    return [command for (command, reached) in zip(commands, reachable) if reached]
+
+def remove_unused_labels(commands):
+    references = label_references(commands)
+    return [command for command in commands if command[0] != "label" or command[1] in references]
+
+# Passes in the order they are run, each pass only makes work for the passes after it so one run of them is enough:
+# loops are rotated before their not is inverted away, inverted branches add gotos to thread, threading leaves code
+# behind jumps unreachable, removing it leaves jumps to the next label and removing those leaves unused labels
+passes = (rotate_loops, invert_branches, thread_jumps, remove_unreachable, remove_jumps_to_next, remove_unused_labels)
+
+def optimize(commands: list) -> list:
+    for optimization in passes:
+        commands = optimization(commands)
+    return commands
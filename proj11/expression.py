@@ -0,0 +1,217 @@
+# Expression IR built by CompilationEngine.compile_expression
+# Literals, unary and binary operations are kept as nodes so they can be folded before any VM code is written,
+# everything else in a term (variables, array reads, calls, strings) is kept as the VM commands it compiled to
+# Operators are named after the VM commands they compile to, * and / are "multiply" and "divide"
+
+# Largest power of two a multiplication is turned into repeated additions for, 2^4 = 16
+MAX_DOUBLINGS = 4
+
+# Temp register a value is parked in while it is doubled
+DOUBLING_TEMP = 1
+
+# Wrap a value around to a signed 16-bit word like the Hack ALU does
+def to_word(value: int) -> int:
+    value &= 0xFFFF
+    return value - 0x10000 if value >= 0x8000 else value
+
+class Constant:
+    __slots__ = ("value",)
+
+    def __init__(self, value: int):
+        self.value = value
+
+# VM commands of a term that is not folded
+class Code:
+    __slots__ = ("commands",)
+
+    def __init__(self, commands: list):
+        self.commands = commands
+
+class Unary:
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op: str, operand):
+        self.op = op
+        self.operand = operand
+
+class Binary:
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op: str, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+# operand * 2^doublings computed with additions instead of Math.multiply
+class Doubled:
+    __slots__ = ("operand", "doublings")
+
+    def __init__(self, operand, doublings: int):
+        self.operand = operand
+        self.doublings = doublings
+
+# True when evaluating the node has no effect besides its value, so it can be left out if the value is not needed
+def is_pure(node) -> bool:
+    if isinstance(node, Constant):
+        return True
+    elif isinstance(node, Code):
+        return all(command[0] != "call" for command in node.commands)
+    elif isinstance(node, Unary):
+        return is_pure(node.operand)
+    elif isinstance(node, Doubled):
+        return is_pure(node.operand)
+    # Math.divide stops the program when dividing by zero, so only multiply counts as pure
+    return node.op != "divide" and is_pure(node.left) and is_pure(node.right)
+
+# A single push of a variable, it can be pushed twice instead of being computed twice
+def is_simple(node) -> bool:
+    return isinstance(node, Code) and len(node.commands) == 1 and node.commands[0][0] == "push" and node.commands[0][1] != "constant"
+
+def fold_unary(op: str, value: int) -> int:
+    return to_word(-value if op == "neg" else ~value)
+
+# Value of a binary operation on two constants, None when it cannot be computed at compile time
+def fold_binary(op: str, left: int, right: int) -> int | None:
+    match op:
+        case "add":
+            return to_word(left + right)
+        case "sub":
+            return to_word(left - right)
+        case "multiply":
+            return to_word(left * right)
+        case "divide":
+            # Division by zero is left to fail at runtime, -32768 / -1 does not fit in a word
+            if right == 0 or (to_word(left) == -32768 and to_word(right) == -1):
+                return None
+            quotient = abs(left) // abs(right)
+            return to_word(quotient if (left < 0) == (right < 0) else -quotient)
+        case "and":
+            return to_word(left & right)
+        case "or":
+            return to_word(left | right)
+        # Hack compares by the sign of the wrapped difference, so 20000 < -20000 is true on the target
+        case "lt":
+            return -1 if to_word(left - right) < 0 else 0
+        case "gt":
+            return -1 if to_word(left - right) > 0 else 0
+        case "eq":
+            return -1 if to_word(left) == to_word(right) else 0
+    return None
+
+# Exponent of a positive power of two up to 2^MAX_DOUBLINGS, None for anything else
+def doublings_of(value: int) -> int | None:
+    if value >= 2 and value & (value - 1) == 0 and value.bit_length() - 1 <= MAX_DOUBLINGS:
+        return value.bit_length() - 1
+    return None
+
+# Fold constant subexpressions and simplify identities, evaluation order and side effects are kept
+def fold(node):
+    if isinstance(node, Unary):
+        operand = fold(node.operand)
+        if isinstance(operand, Constant):
+            return Constant(fold_unary(node.op, operand.value))
+        # - - x and ~ ~ x
+        if isinstance(operand, Unary) and operand.op == node.op:
+            return operand.operand
+        return Unary(node.op, operand)
+    if not isinstance(node, Binary):
+        return node
+
+    op = node.op
+    left = fold(node.left)
+    right = fold(node.right)
+    if isinstance(left, Constant) and isinstance(right, Constant):
+        value = fold_binary(op, left.value, right.value)
+        if value is not None:
+            return Constant(value)
+        return Binary(op, left, right)
+
+    # (x + c1) + c2 and the like, Jack evaluates left to right so a constant on the right ends a chain
+    if (op == "add" or op == "sub") and isinstance(right, Constant) and isinstance(left, Binary) \
+            and (left.op == "add" or left.op == "sub") and isinstance(left.right, Constant):
+        offset = (left.right.value if left.op == "add" else -left.right.value) + (right.value if op == "add" else -right.value)
+        return fold(Binary("add", left.left, Constant(to_word(offset))))
+
+    # Identities, x stands for the side that is not a constant
+    if isinstance(right, Constant):
+        (x, value, constant_on_left) = (left, to_word(right.value), False)
+    elif isinstance(left, Constant):
+        (x, value, constant_on_left) = (right, to_word(left.value), True)
+    else:
+        return Binary(op, left, right)
+    match op:
+        case "add":
+            if value == 0:
+                return x
+        case "sub":
+            if value == 0:
+                return Unary("neg", x) if constant_on_left else x
+        case "multiply":
+            if value == 1:
+                return x
+            if value == -1:
+                return Unary("neg", x)
+            if value == 0 and is_pure(x):
+                return Constant(0)
+            doublings = doublings_of(value)
+            if doublings is not None:
+                return Doubled(x, doublings)
+        case "divide":
+            if not constant_on_left:
+                if value == 1:
+                    return x
+                if value == -1:
+                    return Unary("neg", x)
+        case "and":
+            if value == -1:
+                return x
+            if value == 0 and is_pure(x):
+                return Constant(0)
+        case "or":
+            if value == 0:
+                return x
+            if value == -1 and is_pure(x):
+                return Constant(-1)
+    return Binary(op, left, right)
+
+# Write the VM code of a node
+def write(node, vm_writer):
+    if isinstance(node, Constant):
+        value = node.value
+        if value >= 0:
+            vm_writer.write_int(value)
+        elif value == -32768:
+            # 32768 does not fit in push constant
+            vm_writer.write_int(32767)
+            vm_writer.write_arithmetic("not")
+        else:
+            vm_writer.write_int(-value)
+            vm_writer.write_arithmetic("neg")
+    elif isinstance(node, Code):
+        vm_writer.commands.extend(node.commands)
+    elif isinstance(node, Unary):
+        write(node.operand, vm_writer)
+        vm_writer.write_arithmetic(node.op)
+    elif isinstance(node, Doubled):
+        write(node.operand, vm_writer)
+        doublings = node.doublings
+        if is_simple(node.operand):
+            # x + x without computing x again
+            vm_writer.commands.extend(node.operand.commands)
+            vm_writer.write_arithmetic("add")
+            doublings -= 1
+        for _ in range(doublings):
+            vm_writer.write_pop("temp", DOUBLING_TEMP)
+            vm_writer.write_push("temp", DOUBLING_TEMP)
+            vm_writer.write_push("temp", DOUBLING_TEMP)
+            vm_writer.write_arithmetic("add")
+    else:
+        write(node.left, vm_writer)
+        write(node.right, vm_writer)
+        match node.op:
+            case "multiply":
+                vm_writer.write_call("Math", "multiply", 2)
+            case "divide":
+                vm_writer.write_call("Math", "divide", 2)
+            case _:
+                vm_writer.write_arithmetic(node.op)
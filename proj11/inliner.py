@@ -0,0 +1,165 @@
+from controlflow import label_positions, new_label
+from wholeprogram import ENTRY_POINT, vm_size
+
+# Inlining of small leaf subroutines across the classes of a whole program
+# A leaf calls nothing, so when a call to it is replaced by its body the arguments and locals of the callee can live in
+# extra locals of the caller: they are only used while the body runs and the bodies of two calls never overlap
+
+# Position of every function in commands, function name -> (start, end)
+def function_ranges(commands) -> dict:
+    ranges = {}
+    start = None
+    for (i, command) in enumerate(commands):
+        if command[0] == "function":
+            if start is not None:
+                ranges[commands[start][1]] = (start, i)
+            start = i
+    if start is not None:
+        ranges[commands[start][1]] = (start, len(commands))
+    return ranges
+
+def uses_segment(commands, segment: str, index: int | None = None) -> bool:
+    for command in commands:
+        if (command[0] == "push" or command[0] == "pop") and command[1] == segment and (index is None or command[2] == index):
+            return True
+    return False
+
+# Body of a leaf subroutine, ready to be copied into its callers
+class Callee:
+    __slots__ = ("class_name", "local_count", "body", "binds_this", "via_that", "sets_this")
+
+    def __init__(self, class_name: str, commands: list):
+        self.class_name = class_name
+        self.local_count = commands[0][2]
+        body = commands[1:]
+        # Methods start with push argument 0; pop pointer 0, the receiver then goes straight from the stack to the pointer
+        self.binds_this = body[:2] == [("push", "argument", 0), ("pop", "pointer", 0)] and not uses_segment(body[2:], "argument", 0)
+        if self.binds_this:
+            body = body[2:]
+        # The last return leaves the value on the stack, which is where the call would have left it
+        if len(body) != 0 and body[-1] == ("return",):
+            body = body[:-1]
+        self.body = body
+        # A method that does not use that itself reaches its fields through that, so the THIS of the caller stays intact
+        self.via_that = self.binds_this and not (uses_segment(body, "that") or uses_segment(body, "pointer", 1) or ("pop", "pointer", 0) in body)
+        self.sets_this = (self.binds_this and not self.via_that) or ("pop", "pointer", 0) in body
+
+    # Commands replacing call Class.name argument_count, the callee's variables start at local base
+    # save_this keeps the THIS of the caller in a local while the body runs, returns the commands and the number of locals used
+    def expand(self, argument_count: int, base: int, save_this: bool, labels: dict) -> tuple:
+        first_argument = 1 if self.binds_this else 0
+        locals_base = base + argument_count - first_argument
+        slots = argument_count - first_argument + self.local_count
+        code = []
+        restore_this = save_this and self.sets_this
+        if restore_this:
+            code.extend([("push", "pointer", 0), ("pop", "local", base + slots)])
+            slots += 1
+        # Arguments were pushed in order, so the last one is on top of the stack
+        for i in range(argument_count - 1, first_argument - 1, -1):
+            code.append(("pop", "local", base + i - first_argument))
+        if self.binds_this:
+            code.append(("pop", "pointer", 1 if self.via_that else 0))
+        # Locals start at 0 like after function
+        for i in range(self.local_count):
+            code.extend([("push", "constant", 0), ("pop", "local", locals_base + i)])
+
+        renamed = {}
+        end_label = None
+        for command in self.body:
+            match command[0]:
+                case "push" | "pop":
+                    (segment, index) = command[1:]
+                    if segment == "argument":
+                        command = (command[0], "local", base + index - first_argument)
+                    elif segment == "local":
+                        command = (command[0], "local", locals_base + index)
+                    elif self.via_that and segment == "this":
+                        command = (command[0], "that", index)
+                    elif self.via_that and command == ("push", "pointer", 0):
+                        command = (command[0], "pointer", 1)
+                case "label" | "goto" | "if-goto":
+                    if command[1] not in renamed:
+                        renamed[command[1]] = new_label(command[1] + "_inline", labels)
+                    command = (command[0], renamed[command[1]])
+                case "return":
+                    # A return before the end jumps past the body with its value on the stack
+                    if end_label is None:
+                        end_label = new_label(self.class_name + "_return", labels)
+                    command = ("goto", end_label)
+            code.append(command)
+        if end_label is not None:
+            code.append(("label", end_label))
+        if restore_this:
+            code.extend([("push", "local", base + slots - 1), ("pop", "pointer", 0)])
+        return (code, slots)
+
+# Leaf subroutines of at most max_size VM commands, full name -> Callee
+def leaf_subroutines(class_commands: dict, max_size: int) -> dict:
+    callees = {}
+    for (class_name, commands) in class_commands.items():
+        for (name, (start, end)) in function_ranges(commands).items():
+            function = commands[start:end]
+            if vm_size(function) - 1 <= max_size and not any(command[0] == "call" for command in function):
+                callees[name] = Callee(class_name, function)
+    return callees
+
+# Replace calls to callees in one function, returns the new commands and the number of calls replaced
+def inline_calls(function: list, class_name: str, callees: dict, labels: dict) -> tuple:
+    local_count = function[0][2]
+    # Methods and constructors set THIS, functions never read it
+    save_this = ("pop", "pointer", 0) in function
+    inlined = []
+    extra_locals = 0
+    count = 0
+    for command in function:
+        callee = callees.get(command[1]) if command[0] == "call" else None
+        # Statics belong to the file they are declared in, so a callee using them stays in its own class
+        if callee is None or (callee.class_name != class_name and uses_segment(callee.body, "static")):
+            inlined.append(command)
+            continue
+        (code, slots) = callee.expand(command[2], local_count, save_this, labels)
+        inlined.extend(code)
+        extra_locals = max(extra_locals, slots)
+        count += 1
+    if extra_locals != 0:
+        inlined[0] = ("function", function[0][1], local_count + extra_locals)
+    return (inlined, count)
+
+# Inline calls to leaf subroutines of at most max_size VM commands in every class, class name -> commands
+# Returns the new commands of every class and the number of calls inlined in each
+def inline_program(class_commands: dict, max_size: int) -> tuple:
+    callees = leaf_subroutines(class_commands, max_size)
+    inlined = {}
+    counts = {}
+    for (class_name, commands) in class_commands.items():
+        labels = label_positions(commands)
+        counts[class_name] = 0
+        inlined[class_name] = []
+        for (start, end) in function_ranges(commands).values():
+            (function, count) = inline_calls(commands[start:end], class_name, callees, labels)
+            inlined[class_name].extend(function)
+            counts[class_name] += count
+    return (inlined, counts)
+
+# Remove the functions no call from Main.main reaches anymore, returns the new commands and the removed full names
+def remove_uncalled(class_commands: dict) -> tuple:
+    functions = {}
+    for commands in class_commands.values():
+        for (name, (start, end)) in function_ranges(commands).items():
+            functions[name] = commands[start:end]
+    called = {ENTRY_POINT}
+    pending = [ENTRY_POINT]
+    while len(pending) != 0:
+        for command in functions[pending.pop()]:
+            if command[0] == "call" and command[1] in functions and command[1] not in called:
+                called.add(command[1])
+                pending.append(command[1])
+
+    kept = {}
+    for (class_name, commands) in class_commands.items():
+        kept[class_name] = []
+        for (name, (start, end)) in function_ranges(commands).items():
+            if name in called:
+                kept[class_name].extend(commands[start:end])
+    return (kept, set(functions) - called)
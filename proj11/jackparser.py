@@ -0,0 +1,269 @@
+from language import Keyword, TokenType, binary_operators, unary_operators
+from syntaxtree import (ClassDec, ClassVarDec, SubroutineDec, Parameter, VarDec,
+                        LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement,
+                        Expression, IntegerConstant, StringConstant, KeywordConstant, VarRef, ArrayRef,
+                        SubroutineCall, ParenExpression, UnaryOp)
+
+# Keywords that can be used as a term
+keyword_constants = (Keyword.TRUE, Keyword.FALSE, Keyword.NULL, Keyword.THIS)
+
+# Symbols after a name that make a term an array element or a call instead of a variable
+term_continuations = ("[", ".", "(")
+
+# Reads the tokens of one class into a syntax tree, nothing is written while parsing
+class JackParser:
+    def __init__(self, tokenizer):
+        # JackTokenizer or JackTokenStream
+        self.tokenizer = tokenizer
+
+    def __error(self, message: str):
+        if not self.tokenizer.has_more_tokens():
+            raise Exception(f"{message} at the end of the file")
+        (line, column) = self.tokenizer.location()
+        raise Exception(f"{message} at {line}:{column}")
+
+    # True when the current token is the given symbol
+    # The value is compared first, a string constant can have the same value as a symbol
+    def __at_symbol(self, symbol: str) -> bool:
+        return self.tokenizer.peek(0) == symbol and self.tokenizer.token_type() == TokenType.SYMBOL
+
+    # Consume the current token, which has to be the given symbol
+    def __expect(self, symbol: str):
+        tokenizer = self.tokenizer
+        if tokenizer.peek(0) != symbol or tokenizer.token_type() != TokenType.SYMBOL:
+            self.__error(f"Expected \"{symbol}\" but found \"{tokenizer.peek(0)}\"")
+        tokenizer.advance()
+
+    def __at_keyword(self, keywords: tuple) -> bool:
+        return self.tokenizer.has_more_tokens() and self.tokenizer.token_type() == TokenType.KEYWORD and self.tokenizer.keyword()[0] in keywords
+
+    def __identifier(self) -> str:
+        identifier = self.tokenizer.identifier()
+        self.tokenizer.advance()
+        return identifier
+
+    # Type of a variable or return type of a subroutine, a keyword or a class name
+    def __type(self) -> str:
+        if self.tokenizer.token_type() == TokenType.KEYWORD:
+            return self.tokenizer.advance()
+        return self.__identifier()
+
+    def parse_class(self) -> ClassDec:
+        if not self.__at_keyword((Keyword.CLASS,)):
+            self.__error("Expected a class")
+        self.tokenizer.advance()
+        class_name = self.__identifier()
+        self.__expect("{")
+
+        # Class declaration hierarchy Static -> Field -> Constructor -> Functions/Method(s)
+        class_var_decs = []
+        while self.__at_keyword((Keyword.STATIC, Keyword.FIELD)):
+            class_var_decs.append(self.parse_class_var_dec())
+        subroutines = []
+        while self.__at_keyword((Keyword.CONSTRUCTOR, Keyword.FUNCTION, Keyword.METHOD)):
+            subroutines.append(self.parse_subroutine())
+
+        self.__expect("}")
+        if self.tokenizer.has_more_tokens():
+            raise Exception("More tokens still present")
+        return ClassDec(class_name, class_var_decs, subroutines)
+
+    def parse_class_var_dec(self) -> ClassVarDec:
+        kind = self.tokenizer.advance()
+        var_type = self.__type()
+        names = [self.__identifier()]
+        # Multiple variables defined in one line
+        while self.__at_symbol(","):
+            self.tokenizer.advance()
+            names.append(self.__identifier())
+        self.__expect(";")
+        return ClassVarDec(kind, var_type, names)
+
+    def parse_subroutine(self) -> SubroutineDec:
+        kind = self.tokenizer.advance()
+        return_type = self.__type()
+        name = self.__identifier()
+        self.__expect("(")
+        parameters = self.parse_parameter_list()
+        self.__expect(")")
+
+        # Subroutine body
+        self.__expect("{")
+        var_decs = []
+        while self.__at_keyword((Keyword.VAR,)):
+            var_decs.append(self.parse_var_dec())
+        statements = self.parse_statements()
+        self.__expect("}")
+        return SubroutineDec(kind, return_type, name, parameters, var_decs, statements)
+
+    def parse_parameter_list(self) -> list:
+        parameters = []
+        if self.__at_symbol(")"):
+            return parameters
+        while True:
+            param_type = self.__type()
+            parameters.append(Parameter(param_type, self.__identifier()))
+            if not self.__at_symbol(","):
+                return parameters
+            self.tokenizer.advance()
+
+    def parse_var_dec(self) -> VarDec:
+        # var keyword
+        self.tokenizer.advance()
+        var_type = self.__type()
+        names = [self.__identifier()]
+        while self.__at_symbol(","):
+            self.tokenizer.advance()
+            names.append(self.__identifier())
+        self.__expect(";")
+        return VarDec(var_type, names)
+
+    def parse_statements(self) -> list:
+        statements = []
+        while self.tokenizer.has_more_tokens() and self.tokenizer.token_type() == TokenType.KEYWORD:
+            match self.tokenizer.keyword()[0]:
+                case Keyword.LET:
+                    statements.append(self.parse_let())
+                case Keyword.IF:
+                    statements.append(self.parse_if())
+                case Keyword.DO:
+                    statements.append(self.parse_do())
+                case Keyword.WHILE:
+                    statements.append(self.parse_while())
+                case Keyword.RETURN:
+                    statements.append(self.parse_return())
+                case _:
+                    self.__error(f"Invalid keyword \"{self.tokenizer.curr_token()}\" in statements")
+        return statements
+
+    def parse_let(self) -> LetStatement:
+        # let keyword
+        self.tokenizer.advance()
+        name = self.__identifier()
+        index = None
+        if self.__at_symbol("["):
+            self.tokenizer.advance()
+            index = self.parse_expression()
+            self.__expect("]")
+        self.__expect("=")
+        value = self.parse_expression()
+        self.__expect(";")
+        return LetStatement(name, index, value)
+
+    def parse_if(self) -> IfStatement:
+        # if keyword
+        self.tokenizer.advance()
+        self.__expect("(")
+        condition = self.parse_expression()
+        self.__expect(")")
+        self.__expect("{")
+        statements = self.parse_statements()
+        self.__expect("}")
+
+        else_statements = None
+        if self.__at_keyword((Keyword.ELSE,)):
+            self.tokenizer.advance()
+            self.__expect("{")
+            else_statements = self.parse_statements()
+            self.__expect("}")
+        return IfStatement(condition, statements, else_statements)
+
+    def parse_while(self) -> WhileStatement:
+        # while keyword
+        self.tokenizer.advance()
+        self.__expect("(")
+        condition = self.parse_expression()
+        self.__expect(")")
+        self.__expect("{")
+        statements = self.parse_statements()
+        self.__expect("}")
+        return WhileStatement(condition, statements)
+
+    def parse_do(self) -> DoStatement:
+        # do keyword
+        self.tokenizer.advance()
+        call = self.parse_subroutine_call(self.__identifier())
+        self.__expect(";")
+        return DoStatement(call)
+
+    def parse_return(self) -> ReturnStatement:
+        # return keyword
+        self.tokenizer.advance()
+        value = None
+        if not self.__at_symbol(";"):
+            value = self.parse_expression()
+        self.__expect(";")
+        return ReturnStatement(value)
+
+    # The rest of a call after its first identifier, name(...) or receiver.name(...)
+    def parse_subroutine_call(self, name: str) -> SubroutineCall:
+        receiver = None
+        if self.__at_symbol("."):
+            self.tokenizer.advance()
+            receiver = name
+            name = self.__identifier()
+        self.__expect("(")
+        arguments = self.parse_expression_list()
+        self.__expect(")")
+        return SubroutineCall(receiver, name, arguments)
+
+    def parse_expression(self) -> Expression:
+        tokenizer = self.tokenizer
+        terms = [self.parse_term()]
+        ops = []
+        while tokenizer.peek(0) in binary_operators and tokenizer.token_type() == TokenType.SYMBOL:
+            ops.append(tokenizer.advance())
+            terms.append(self.parse_term())
+        return Expression(terms, ops)
+
+    def parse_term(self):
+        tokenizer = self.tokenizer
+        if not tokenizer.has_more_tokens():
+            self.__error("Expected a term")
+        match tokenizer.token_type():
+            case TokenType.INT_CONST:
+                term = IntegerConstant(tokenizer.int_val())
+                tokenizer.advance()
+                return term
+            case TokenType.STRING_CONST:
+                term = StringConstant(tokenizer.string_val())
+                tokenizer.advance()
+                return term
+            case TokenType.KEYWORD:
+                (keyword_type, keyword_val) = tokenizer.keyword()
+                if keyword_type not in keyword_constants:
+                    self.__error(f"Unexpected keyword \"{keyword_val}\" in an expression")
+                tokenizer.advance()
+                return KeywordConstant(keyword_val)
+            case TokenType.SYMBOL:
+                symbol = tokenizer.symbol()
+                if symbol == "(":
+                    tokenizer.advance()
+                    term = ParenExpression(self.parse_expression())
+                    self.__expect(")")
+                    return term
+                if symbol in unary_operators:
+                    tokenizer.advance()
+                    return UnaryOp(symbol, self.parse_term())
+                self.__error(f"Expected a term but found \"{symbol}\"")
+            case _:
+                name = self.__identifier()
+                following = tokenizer.peek(0)
+                if following in term_continuations and tokenizer.token_type() == TokenType.SYMBOL:
+                    if following == "[":
+                        tokenizer.advance()
+                        term = ArrayRef(name, self.parse_expression())
+                        self.__expect("]")
+                        return term
+                    return self.parse_subroutine_call(name)
+                return VarRef(name)
+
+    def parse_expression_list(self) -> list:
+        expressions = []
+        if self.__at_symbol(")"):
+            return expressions
+        expressions.append(self.parse_expression())
+        while self.__at_symbol(","):
+            self.tokenizer.advance()
+            expressions.append(self.parse_expression())
+        return expressions
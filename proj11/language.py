@@ -54,7 +54,36 @@ class Keyword(Enum):
     NULL = 20, 
     THIS = 21
 
+# Keyword enum for every keyword, looked up once when the token is lexed
+keyword_lookup = {
+    "class": Keyword.CLASS,
+    "constructor": Keyword.CONSTRUCTOR,
+    "function": Keyword.FUNCTION,
+    "method": Keyword.METHOD,
+    "field": Keyword.FIELD,
+    "static": Keyword.STATIC,
+    "var": Keyword.VAR,
+    "int": Keyword.INT,
+    "char": Keyword.CHAR,
+    "boolean": Keyword.BOOLEAN,
+    "void": Keyword.VOID,
+    "true": Keyword.TRUE,
+    "false": Keyword.FALSE,
+    "null": Keyword.NULL,
+    "this": Keyword.THIS,
+    "let": Keyword.LET,
+    "do": Keyword.DO,
+    "if": Keyword.IF,
+    "else": Keyword.ELSE,
+    "while": Keyword.WHILE,
+    "return": Keyword.RETURN
+}
+
 symbols = ("{", "}", "(", ")", "[", "]", ".", ",", ";", "+", "-", "*", "/", "&", "|", "<", ">", "=", "~")
+binary_operators = ("+", "-", "*", "/", "&", "|", "<", ">", "=")
+unary_operators = ("-", "~")
+# Types that are keywords, every other type is a class name
+primitive_types = ("int", "char", "boolean", "void")
 
 class ValType(Enum):
     STATIC = 1,
@@ -1,88 +1,363 @@
 # Project 10/11
 # Vincent Nguyen
+import argparse
+import io
 import shutil
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
 import xml.etree.ElementTree as xml_et
-from tokenizer import JackTokenizer
+from tokenizer import JackTokenizer, JackTokenStream
 from language import TokenType
 from compengine import CompilationEngine
+import peephole
+import wholeprogram
+import inliner
+from asmwriter import AsmWriter
+from buildcache import BuildCache, compiler_fingerprint, source_hash
 
 OUTPUT_TOKENIZED_CODE = False
+# Write the parse tree as .xml next to the .vm code, turning it off skips building the tree entirely
+OUTPUT_PARSE_TREE = True
+# Lex .jack files lazily while they are parsed instead of tokenizing the whole file up front
+STREAM_TOKENS = False
 
 outdir = "./out"
 
+def output_tokenized_code(input_path, tokenized_output_name):
+    TOKENIZER = JackTokenizer(input_path)
+
+    # Output to file
+    root = xml_et.Element("tokens")
+    while TOKENIZER.has_more_tokens():
+        # Convert enum type to string and get the token value
+        stringified_type = None
+        token_value = None
+        match TOKENIZER.token_type():
+            case TokenType.KEYWORD:
+                stringified_type = "keyword"
+                (_, token_value) = TOKENIZER.keyword()
+            case TokenType.SYMBOL:
+                stringified_type = "symbol"
+                token_value = TOKENIZER.symbol()
+            case TokenType.IDENTIFIER:
+                stringified_type = "identifier"
+                token_value = TOKENIZER.identifier()
+            case TokenType.INT_CONST:
+                stringified_type = "integerConstant"
+                token_value = TOKENIZER.int_val()
+            case TokenType.STRING_CONST:
+                stringified_type = "stringConstant"
+                token_value = TOKENIZER.string_val()
+
+        # Error checking
+        if stringified_type == None and token_value == None: raise Exception("Invalid token type output to XML")
+
+        token = xml_et.SubElement(root, stringified_type)
+        token.text = str(token_value)
+
+        TOKENIZER.advance()
+
+    tree = xml_et.ElementTree(root)
+    xml_et.indent(tree, space="\t", level = 0)
+    os.makedirs(os.path.dirname(tokenized_output_name), exist_ok=True)
+    tree.write(tokenized_output_name, encoding="utf-8", xml_declaration=False)
+
+# Paths of the files compiling a class writes, the build cache removes them when the class is deleted
+def output_paths(file_name) -> list:
+    paths = [os.path.join("out", "{}.vm".format(file_name))]
+    if OUTPUT_PARSE_TREE:
+        paths.append(os.path.join("out", "{}.xml".format(file_name)))
+    if OUTPUT_TOKENIZED_CODE:
+        paths.append(os.path.join("out", "{}T.xml".format(file_name)))
+    return paths
+
+# vm_output is a stream to write the VM code to instead of ./out, nothing else is written then
+# profile is the profiler.FileProfile the phases of the class are timed in, if any
+def compile_jack(file_name, input_path, tokenizer=None, vm_output=None, engine_options=None, profile=None):
+    # Output file path
+    completed_output_name = os.path.join("out", "{}.xml".format(file_name))
+    tokenized_output_name = os.path.join("out", "{}T.xml".format(file_name))
+    vm_output_name = os.path.join("out", "{}.vm".format(file_name))
+    to_files = vm_output is None
+
+    # Tokenizer, a stream (stdin) can only be read once so it is not tokenized on its own
+    if OUTPUT_TOKENIZED_CODE and tokenizer is None and to_files:
+        output_tokenized_code(input_path, tokenized_output_name)
+
+    # Running through CompilationEngine
+    engine = CompilationEngine(input_path, completed_output_name if OUTPUT_PARSE_TREE and to_files else None, vm_output_name if to_files else vm_output, tokenizer, profile=profile, **(engine_options or {}))
+    # Compile the class the file defines
+    engine.compile_class()
+    # Output XML
+    engine.output_tokenized_parsed_code()
+    # Output VM code
+    engine.output_vm_code()
+
+# Compile one .jack file, also what each worker process runs when compiling with several jobs
+# With in_memory the VM code is returned instead of written to ./out
+def compile_jack_file(input_path, in_memory=False, engine_options=None, profile=None) -> str | None:
+    file_name = os.path.basename(input_path)[:-5]
+    vm_output = io.StringIO() if in_memory else None
+    if STREAM_TOKENS:
+        with open(input_path) as f:
+            compile_jack(file_name, input_path, JackTokenStream(f), vm_output, engine_options, profile)
+    else:
+        compile_jack(file_name, input_path, vm_output=vm_output, engine_options=engine_options, profile=profile)
+    return vm_output.getvalue() if in_memory else None
+
+# Compile every file, collecting the error of each file that fails instead of stopping at the first one
+# When vm_output is a stream the VM code of every file is written to it in file order
+# With a profiler.Profiler every file is profiled, which only works when they compile in this process
+def compile_jack_files(input_paths, jobs, vm_output=None, engine_options=None, profiler=None):
+    errors = []
+    in_memory = vm_output is not None
+    if jobs == 1 or len(input_paths) <= 1:
+        for input_path in input_paths:
+            profile = profiler.file(input_path) if profiler is not None else None
+            try:
+                vm_code = compile_jack_file(input_path, in_memory, engine_options, profile)
+                if in_memory:
+                    vm_output.write(vm_code)
+            except Exception as e:
+                errors.append((input_path, e))
+                if profile is not None:
+                    profile.error = str(e)
+    else:
+        # Classes compile independently, every worker writes the output files of its own class
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(compile_jack_file, input_path, in_memory, engine_options) for input_path in input_paths]
+            # Results are gathered in file order so errors are reported the same way on every run
+            for (input_path, future) in zip(input_paths, futures):
+                try:
+                    vm_code = future.result()
+                    if in_memory:
+                        vm_output.write(vm_code)
+                except Exception as e:
+                    errors.append((input_path, e))
+    return errors
+
+# Compile every file into one Hack assembly program, the VM commands of each class go straight to asm_writer
+def compile_jack_files_to_asm(input_paths, asm_writer, engine_options=None, profiler=None):
+    errors = []
+    for input_path in input_paths:
+        profile = profiler.file(input_path) if profiler is not None else None
+        try:
+            compile_jack(os.path.basename(input_path)[:-5], input_path, vm_output=asm_writer, engine_options=engine_options, profile=profile)
+        except Exception as e:
+            errors.append((input_path, e))
+            if profile is not None:
+                profile.error = str(e)
+    return errors
+
+# Whole program mode, every class is parsed before any is compiled so only what Main.main reaches is compiled
+# Returns the errors and the size report, when vm_output is a stream the VM code of every class is written to it
+# Calls to leaf subroutines of at most inline_size VM commands are inlined when it is given
+def compile_program(input_paths, vm_output=None, engine_options=None, inline_size=None, profiler=None):
+    engine_options = engine_options or {}
+    to_files = vm_output is None
+    engines = []
+    errors = []
+    for input_path in input_paths:
+        file_name = os.path.basename(input_path)[:-5]
+        xml_output_name = os.path.join("out", "{}.xml".format(file_name)) if OUTPUT_PARSE_TREE and to_files else None
+        profile = profiler.file(input_path) if profiler is not None else None
+        engine = CompilationEngine(input_path, xml_output_name, os.path.join("out", "{}.vm".format(file_name)) if to_files else vm_output, profile=profile, **engine_options)
+        try:
+            engine.parse_class()
+            engine.output_tokenized_parsed_code()
+            engines.append(engine)
+        except Exception as e:
+            errors.append((input_path, e))
+            if profile is not None:
+                profile.error = str(e)
+    # Calls into a class that does not parse cannot be followed
+    if len(errors) != 0:
+        return (errors, None)
+
+    # Size of every class compiled on its own, for the report
+    sizes_before = []
+    for engine in engines:
+        separate_engine = CompilationEngine(engine.input_path, None, None, **engine_options)
+        separate_engine.compile_class_dec(engine.class_dec)
+        separate_engine.optimize_vm_code()
+        sizes_before.append(wholeprogram.vm_size(separate_engine.vm_writer.commands))
+
+    dead_statements = [wholeprogram.remove_dead_code(engine.class_dec) for engine in engines]
+    reachable = wholeprogram.reachable_subroutines([engine.class_dec for engine in engines])
+    for engine in engines:
+        engine.compile_class_dec(engine.class_dec, reachable)
+        engine.optimize_vm_code()
+
+    inlined_calls = {}
+    if inline_size is not None:
+        class_commands = {engine.class_name: engine.vm_writer.commands for engine in engines}
+        (class_commands, inlined_calls) = inliner.inline_program(class_commands, inline_size)
+        # Subroutines whose every call was inlined are not called anymore
+        (class_commands, uncalled) = inliner.remove_uncalled(class_commands)
+        reachable -= uncalled
+        for engine in engines:
+            engine.vm_writer.commands = class_commands[engine.class_name]
+            # Inlined bodies next to their callers' code can be optimized further
+            if inlined_calls[engine.class_name] != 0:
+                engine.optimize_vm_code()
+
+    rows = []
+    for (engine, size_before, class_dead_statements) in zip(engines, sizes_before, dead_statements):
+        engine.write_vm_code()
+        class_dec = engine.class_dec
+        subroutine_names = [subroutine.name for subroutine in class_dec.subroutines]
+        removed_names = [name for name in subroutine_names if "{}.{}".format(class_dec.name, name) not in reachable]
+        rows.append((class_dec.name, subroutine_names, removed_names, class_dead_statements, inlined_calls.get(class_dec.name, 0), size_before, wholeprogram.vm_size(engine.vm_writer.commands)))
+    return (errors, wholeprogram.size_report(rows))
+
 # Instead of JackAnalyzer, we are using this main function to invoke JackTokenizer and CompilationEngine
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Invalid arguments")
-        exit()
+    arg_parser = argparse.ArgumentParser(description="Compile Jack classes to VM code")
+    arg_parser.add_argument("path", help="directory with .jack files, or - to read a single class from stdin")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of files compiled in parallel (default: one per CPU core)")
+    arg_parser.add_argument("--rebuild", action="store_true", help="ignore the build cache and compile every file")
+    arg_parser.add_argument("--stdout", action="store_true", help="write the VM code to stdout instead of ./out")
+    arg_parser.add_argument("--emit", choices=("vm", "asm"), default="vm", help="vm writes a .vm file per class, asm translates the whole program with p8.py into ./out/<directory>.asm in this process, without the build cache and without VM code in between")
+    arg_parser.add_argument("-O", "--optimize", action="store_true", help="turn on every optimization: constant folding, all peephole rules and control flow optimization")
+    arg_parser.add_argument("--fold", action="store_true", help="fold constant subexpressions and simplify identities")
+    arg_parser.add_argument("--peephole", metavar="RULES", help="comma separated peephole rules to run: " + ", ".join(peephole.rules))
+    arg_parser.add_argument("--control-flow", action="store_true", help="thread jumps, move loop conditions to the bottom and remove jumps to the next command and unused labels")
+    arg_parser.add_argument("--whole-program", action="store_true", help="compile only the subroutines Main.main can reach and print what was removed from each class, every file is compiled in this process without the build cache")
+    arg_parser.add_argument("--inline", metavar="N", type=int, help="inline calls to subroutines of at most N VM commands that call nothing themselves, turns on --whole-program")
+    arg_parser.add_argument("--vm-extensions", action="store_true", help="copy values already on top of the stack with dup and add or subtract 1 with inc and dec, which p8.py translates, not part of -O since other VM translators do not")
+    arg_parser.add_argument("--profile", metavar="JSON", help="compile every file in this process, print the time and tracemalloc peak of each phase per file to stderr and write them as JSON to this path")
+    arg_parser.add_argument("--pool-strings", action="store_true", help="build each string constant once per class and reuse it, not part of -O since the strings are shared")
+    args = arg_parser.parse_args()
+    if args.jobs < 1:
+        arg_parser.error("--jobs must be at least 1")
+    if args.inline is not None:
+        if args.inline < 1:
+            arg_parser.error("--inline must be at least 1")
+        args.whole_program = True
+    if args.whole_program and args.path == "-":
+        arg_parser.error("--whole-program needs a directory with every class of the program")
+
+    profiler = None
+    if args.profile is not None:
+        # Only imported when profiling, tracemalloc alone takes longer to import than a small class takes to compile
+        from profiler import Profiler
+        profiler = Profiler()
+        # Workers cannot report their phases and a cached class is not compiled at all
+        args.jobs = 1
+        args.rebuild = True
+
+    # Peephole rules, none unless asked for so the VM code matches the reference compiler by default
+    peephole_rules = ()
+    if args.peephole is not None:
+        peephole_rules = tuple(rule for rule in args.peephole.split(",") if rule != "")
+        for rule in peephole_rules:
+            if rule not in peephole.rules:
+                arg_parser.error(f"unknown peephole rule {rule}")
+    elif args.optimize:
+        peephole_rules = tuple(peephole.rules)
+
+    # Keyword arguments of CompilationEngine, they decide the VM code so they are part of the build cache fingerprint
+    engine_options = {"peephole_rules": peephole_rules, "fold_constants": args.fold or args.optimize, "pool_strings": args.pool_strings, "control_flow": args.control_flow or args.optimize, "vm_extensions": args.vm_extensions}
 
-    # Input file path
-    path_arg = sys.argv[1]
+    # Input file path, - reads a single class from stdin
+    path_arg = args.path
     jack_files = []
     if os.path.isdir(path_arg):
         # remove trailing slash /
         if path_arg[-1:] == "/":
             path_arg = path_arg[:-1]
-        jack_files = list(filter(lambda x: x[-5:] == ".jack", os.listdir(path_arg)))
-
-    if os.path.exists(outdir):
-        shutil.rmtree(outdir)
-
-    # Tokenize and parse all Jack files
-    for jack_file in jack_files:
-        file_name = jack_file[:-5]
-        # Output file path
-        completed_output_name = os.path.join("out", "{}.xml".format(file_name))
-        tokenized_output_name = os.path.join("out", "{}T.xml".format(file_name))
-        vm_output_name = os.path.join("out", "{}.vm".format(file_name))
-
-        # Tokenizer
-        if OUTPUT_TOKENIZED_CODE:
-            TOKENIZER = JackTokenizer(os.path.join(path_arg, jack_file))
-
-            # Output to file
-            root = xml_et.Element("tokens")
-            while TOKENIZER.has_more_tokens():
-                # Convert enum type to string and get the token value
-                stringified_type = None
-                token_value = None
-                match TOKENIZER.token_type():
-                    case TokenType.KEYWORD:
-                        stringified_type = "keyword"
-                        (_, token_value) = TOKENIZER.keyword()
-                    case TokenType.SYMBOL:
-                        stringified_type = "symbol"
-                        token_value = TOKENIZER.symbol()
-                    case TokenType.IDENTIFIER:
-                        stringified_type = "identifier"
-                        token_value = TOKENIZER.identifier()
-                    case TokenType.INT_CONST:
-                        stringified_type = "integerConstant"
-                        token_value = TOKENIZER.int_val()
-                    case TokenType.STRING_CONST:
-                        stringified_type = "stringConstant"
-                        token_value = TOKENIZER.string_val()
-
-                # Error checking
-                if stringified_type == None and token_value == None: raise Exception("Invalid token type output to XML")
-                
-                token = xml_et.SubElement(root, stringified_type)
-                token.text = str(token_value)
-
-                TOKENIZER.advance()
-
-            tree = xml_et.ElementTree(root)
-            xml_et.indent(tree, space="\t", level = 0)
-            os.makedirs(os.path.dirname(tokenized_output_name), exist_ok=True)
-            tree.write(tokenized_output_name, encoding="utf-8", xml_declaration=False)
-
-        # Running through CompilationEngine
-        engine = CompilationEngine(str(os.path.join(path_arg, jack_file)), completed_output_name, vm_output_name)
-        # Compile the class the file defines
-        engine.compile_class()
-        # Output XML
-        engine.output_tokenized_parsed_code()
-        # Output VM code
-        engine.output_vm_code()
\ No newline at end of file
+        jack_files = sorted(filter(lambda x: x[-5:] == ".jack", os.listdir(path_arg)))
+
+    errors = []
+    jack_paths = [os.path.join(path_arg, jack_file) for jack_file in jack_files]
+    if profiler is not None:
+        profiler.start()
+    if args.emit == "asm":
+        # One .asm file named after the directory is the only output
+        tokenizer = None
+        if path_arg == "-":
+            tokenizer = JackTokenStream(sys.stdin)
+            program_name = tokenizer.peek(1)
+            if program_name is None:
+                raise Exception("No class found on stdin")
+        else:
+            program_name = os.path.basename(os.path.abspath(path_arg))
+        asm_writer = AsmWriter(sys.stdout if args.stdout else os.path.join(outdir, "{}.asm".format(program_name)))
+        if args.whole_program:
+            (errors, report) = compile_program(jack_paths, asm_writer, engine_options, args.inline, profiler)
+            if report is not None:
+                print(report, end="", file=sys.stderr if args.stdout else sys.stdout)
+        elif path_arg == "-":
+            compile_jack(None, "-", tokenizer, asm_writer, engine_options, profiler.file("-") if profiler is not None else None)
+        else:
+            errors = compile_jack_files_to_asm(jack_paths, asm_writer, engine_options, profiler)
+        # .vm files without a class next to them, e.g. the OS, are part of the program like p8.py takes them
+        if path_arg != "-":
+            for vm_file in sorted(filter(lambda x: x[-3:] == ".vm" and x[:-3] + ".jack" not in jack_files, os.listdir(path_arg))):
+                asm_writer.write_vm_file(os.path.join(path_arg, vm_file))
+        asm_writer.close()
+    elif args.whole_program:
+        if args.stdout:
+            (errors, report) = compile_program(jack_paths, sys.stdout, engine_options, args.inline, profiler)
+        else:
+            # What is compiled depends on every class, so outputs of single classes cannot be reused
+            if os.path.exists(outdir):
+                shutil.rmtree(outdir)
+            (errors, report) = compile_program(jack_paths, engine_options=engine_options, inline_size=args.inline, profiler=profiler)
+        if report is not None:
+            print(report, end="", file=sys.stderr if args.stdout else sys.stdout)
+    elif args.stdout:
+        # Nothing is written to ./out, so there is nothing to cache either
+        if path_arg == "-":
+            compile_jack(None, "-", JackTokenStream(sys.stdin), sys.stdout, engine_options, profiler.file("-") if profiler is not None else None)
+        else:
+            errors = compile_jack_files(jack_paths, args.jobs, sys.stdout, engine_options, profiler)
+    elif path_arg == "-":
+        if os.path.exists(outdir):
+            shutil.rmtree(outdir)
+
+        # Tokens are lexed as the class is compiled, the class name names the output files
+        tokenizer = JackTokenStream(sys.stdin)
+        class_name = tokenizer.peek(1)
+        if class_name is None:
+            raise Exception("No class found on stdin")
+        compile_jack(class_name, "-", tokenizer, engine_options=engine_options, profile=profiler.file("-") if profiler is not None else None)
+    else:
+        # Only classes whose source changed since the last build are compiled again
+        cache = BuildCache(outdir, path_arg, compiler_fingerprint((OUTPUT_TOKENIZED_CODE, OUTPUT_PARSE_TREE, engine_options)))
+        if args.rebuild or not cache.valid:
+            # Outputs of another compiler version or another directory cannot be reused
+            if os.path.exists(outdir):
+                shutil.rmtree(outdir)
+            cache.entries = {}
+
+        # Outputs of files deleted since the last build
+        for jack_file in cache.file_names():
+            if jack_file not in jack_files:
+                cache.forget(jack_file)
+
+        source_hashes = {jack_file: source_hash(os.path.join(path_arg, jack_file)) for jack_file in jack_files}
+        stale_files = [jack_file for jack_file in jack_files if not cache.is_fresh(jack_file, source_hashes[jack_file])]
+
+        # Tokenize and parse all Jack files that changed
+        errors = compile_jack_files([os.path.join(path_arg, jack_file) for jack_file in stale_files], args.jobs, engine_options=engine_options, profiler=profiler)
+        failed_paths = {input_path for (input_path, _) in errors}
+        for jack_file in stale_files:
+            cache.update(jack_file, source_hashes[jack_file], output_paths(jack_file[:-5]))
+            if os.path.join(path_arg, jack_file) in failed_paths:
+                # Whatever a failed file left behind is removed, it is compiled again on the next build
+                cache.forget(jack_file)
+        cache.save()
+
+    if profiler is not None:
+        profiler.stop()
+        with open(args.profile, "w") as profile_file:
+            profile_file.write(profiler.to_json())
+        print(profiler.summary(), end="", file=sys.stderr)
+
+    if len(errors) != 0:
+        for (input_path, e) in errors:
+            print(f"{input_path}: {e}", file=sys.stderr)
+        print(f"{len(errors)} of {len(jack_files)} files failed to compile", file=sys.stderr)
+        exit(1)
@@ -0,0 +1,95 @@
+# Peephole optimization of the VM commands a CompilationEngine produced
+# Commands are the (opcode, args...) tuples of VMWriter.commands
+# Every rule looks at a short window of commands starting at one position and returns (commands matched, replacement),
+# or None when it does not apply. Jumps only land on labels, so a window without a label in the middle is always
+# entered at its first command and can be rewritten as a whole
+
+# Opcodes that always leave true (-1) or false (0) on the stack
+boolean_opcodes = {"eq", "gt", "lt"}
+
+# push S i; pop S i stores the value back where it came from
+def push_pop_same_slot(commands, i):
+    if i + 1 < len(commands):
+        (first, second) = (commands[i], commands[i + 1])
+        if first[0] == "push" and second[0] == "pop" and first[1:] == second[1:]:
+            return (2, [])
+    return None
+
+# not; not and neg; neg give back the value they started with
+def double_negation(commands, i):
+    if i + 1 < len(commands):
+        op = commands[i][0]
+        if (op == "not" or op == "neg") and commands[i + 1][0] == op:
+            return (2, [])
+    return None
+
+# comparison; not; if-goto L1; goto L2; label L1 -> comparison; if-goto L2; label L1
+# Only done after a comparison, if-goto jumps on any value but zero so not only inverts true and false
+def invert_branch(commands, i):
+    if i + 4 < len(commands) and commands[i][0] in boolean_opcodes:
+        (negate, branch, jump, label) = commands[i + 1:i + 5]
+        if negate[0] == "not" and branch[0] == "if-goto" and jump[0] == "goto" and label == ("label", branch[1]):
+            return (5, [commands[i], ("if-goto", jump[1]), label])
+    return None
+
+# push constant c; (neg | not)*; if-goto L -> goto L when the value is not zero, nothing when it is
+# e.g. while (true) compiles to push constant 1; neg; not; if-goto END
+def constant_branch(commands, i):
+    if commands[i][0] != "push" or commands[i][1] != "constant":
+        return None
+    value = commands[i][2]
+    end = i + 1
+    while end < len(commands) and (commands[end][0] == "neg" or commands[end][0] == "not"):
+        value = -value if commands[end][0] == "neg" else ~value
+        end += 1
+    if end < len(commands) and commands[end][0] == "if-goto":
+        return (end + 1 - i, [("goto", commands[end][1])] if value & 0xFFFF != 0 else [])
+    return None
+
+# push S i; pop temp 0; pop pointer 1; push temp 0; pop that 0 -> pop pointer 1; push S i; pop that 0
+# Array writes of a single pushed value do not need to park it in temp 0 while THAT is set
+def array_store(commands, i):
+    if i + 4 < len(commands):
+        value = commands[i]
+        if value[0] != "push" or value[1] == "that" or value[1:] == ("pointer", 1):
+            return None
+        if commands[i + 1:i + 5] == [("pop", "temp", 0), ("pop", "pointer", 1), ("push", "temp", 0), ("pop", "that", 0)]:
+            return (5, [("pop", "pointer", 1), value, ("pop", "that", 0)])
+    return None
+
+# Rules by the name they are enabled with, tried in this order at every position
+rules = {
+    "push-pop": push_pop_same_slot,
+    "double-negation": double_negation,
+    "invert-branch": invert_branch,
+    "constant-branch": constant_branch,
+    "array-store": array_store,
+}
+
+# Rewrite commands with the named rules until none of them applies anywhere
+def optimize(commands: list, rule_names) -> list:
+    enabled_rules = []
+    for name in rule_names:
+        if name not in rules:
+            raise Exception(f"Unknown peephole rule \"{name}\"")
+        enabled_rules.append(rules[name])
+
+    changed = len(enabled_rules) != 0
+    while changed:
+        changed = False
+        optimized = []
+        i = 0
+        while i < len(commands):
+            for rule in enabled_rules:
+                rewrite = rule(commands, i)
+                if rewrite is not None:
+                    (matched, replacement) = rewrite
+                    optimized.extend(replacement)
+                    i += matched
+                    changed = True
+                    break
+            else:
+                optimized.append(commands[i])
+                i += 1
+        commands = optimized
+    return commands
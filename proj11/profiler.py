@@ -0,0 +1,115 @@
+import json
+import time
+import tracemalloc
+
+# Phases of compiling a class in the order they run
+# lex: JackTokenizer reading the file (a JackTokenStream lexes while it is parsed), parse: JackParser, xml: the parse
+# tree XML built and written, codegen: the compile_* methods, optimize: the VM passes, write: the .vm or .asm output
+phases = ("lex", "parse", "xml", "codegen", "optimize", "write")
+
+# Wall time and tracemalloc peak of one phase, used as a context manager
+class Phase:
+    __slots__ = ("times", "name", "start", "start_memory")
+
+    def __init__(self, times: dict, name: str):
+        # times is the FileProfile.phases dict the phase is added to
+        self.times = times
+        self.name = name
+        self.start = 0.0
+        self.start_memory = 0
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        # Bytes allocated on top of what was allocated when the phase started, at the highest point
+        peak = tracemalloc.get_traced_memory()[1] - self.start_memory if tracemalloc.is_tracing() else 0
+        # A phase that runs more than once adds up its time and keeps its highest peak
+        (total_seconds, total_peak) = self.times.get(self.name, (0.0, 0))
+        self.times[self.name] = (total_seconds + seconds, max(total_peak, peak))
+        return False
+
+# Phases and counts of one compiled file
+class FileProfile:
+    __slots__ = ("file", "phases", "tokens", "vm_commands", "error")
+
+    def __init__(self, file: str):
+        self.file = file
+        # Phase name -> (seconds, peak bytes)
+        self.phases = {}
+        self.tokens = 0
+        # VM commands emitted, labels not counted
+        self.vm_commands = 0
+        self.error = None
+
+    def phase(self, name: str) -> Phase:
+        return Phase(self.phases, name)
+
+    def to_json(self) -> dict:
+        return {
+            "file": self.file,
+            "tokens": self.tokens,
+            "vm_commands": self.vm_commands,
+            "phases": {name: {"seconds": seconds, "peak_bytes": peak} for (name, (seconds, peak)) in self.phases.items()},
+            "error": self.error,
+        }
+
+# Profiles of every file of a build, times are measured while tracemalloc traces the allocations so they include
+# its overhead
+class Profiler:
+    def __init__(self):
+        self.files = []
+
+    def start(self):
+        tracemalloc.start()
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def file(self, path: str) -> FileProfile:
+        profile = FileProfile(path)
+        self.files.append(profile)
+        return profile
+
+    # Phase name -> (seconds, peak bytes) over all files
+    def totals(self) -> dict:
+        totals = {}
+        for profile in self.files:
+            for (name, (seconds, peak)) in profile.phases.items():
+                (total_seconds, total_peak) = totals.get(name, (0.0, 0))
+                totals[name] = (total_seconds + seconds, max(total_peak, peak))
+        return totals
+
+    def to_json(self) -> str:
+        totals = self.totals()
+        return json.dumps({
+            "phases": list(phases),
+            "tracemalloc": True,
+            "files": [profile.to_json() for profile in self.files],
+            "totals": {
+                "tokens": sum(profile.tokens for profile in self.files),
+                "vm_commands": sum(profile.vm_commands for profile in self.files),
+                "phases": {name: {"seconds": seconds, "peak_bytes": peak} for (name, (seconds, peak)) in totals.items()},
+            },
+        }, indent=2)
+
+    # Table of the milliseconds of every phase per file, with the highest peak of the file's phases
+    def summary(self) -> str:
+        name_width = max([len("file")] + [len(profile.file) for profile in self.files])
+        header = f"{'file':<{name_width}} {'tokens':>7} {'VM cmds':>7}" + "".join(f" {name:>8}" for name in phases) + f" {'total ms':>9} {'peak KiB':>9}"
+        lines = [header]
+        rows = [(profile.file, profile.tokens, profile.vm_commands, profile.phases) for profile in self.files]
+        rows.append(("total", sum(row[1] for row in rows), sum(row[2] for row in rows), self.totals()))
+        for (file, tokens, vm_commands, file_phases) in rows:
+            line = f"{file:<{name_width}} {tokens:>7} {vm_commands:>7}"
+            for name in phases:
+                line += f" {file_phases[name][0] * 1000:>8.2f}" if name in file_phases else f" {'-':>8}"
+            total = sum(seconds for (seconds, _) in file_phases.values())
+            peak = max([peak for (_, peak) in file_phases.values()], default=0)
+            lines.append(line + f" {total * 1000:>9.2f} {peak / 1024:>9.1f}")
+        return "\n".join(lines) + "\n"
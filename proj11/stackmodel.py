@@ -0,0 +1,103 @@
+# Stack model optimization of the VM commands a CompilationEngine produced, using the dup, inc and dec extensions
+# dup pushes a copy of the value on top of the stack, inc and dec add 1 to it and subtract 1 from it. p8.py translates
+# them, other VM translators do not know them
+
+# Segments where a copy of the value on top of the stack is cheaper than loading it again
+# Constants and statics are loaded by p8.py as fast as dup copies them
+dup_segments = {"local", "argument", "this", "that", "temp", "pointer"}
+
+# Segments addressed through pointer 0 and pointer 1, a write to one can change any variable of both
+heap_segments = {"this", "that"}
+
+# Number of values each opcode pops and pushes, call and the commands ending a basic block are handled on their own
+stack_effects = {
+    "add": (2, 1),
+    "sub": (2, 1),
+    "and": (2, 1),
+    "or": (2, 1),
+    "eq": (2, 1),
+    "gt": (2, 1),
+    "lt": (2, 1),
+    "neg": (1, 1),
+    "not": (1, 1),
+    "inc": (1, 1),
+    "dec": (1, 1),
+    "if-goto": (1, 0),
+}
+
+# push constant 1; add -> inc and push constant 1; sub -> dec, push constant 1; push S i; add -> push S i; inc
+def fuse_increments(commands):
+    fused = []
+    i = 0
+    while i < len(commands):
+        command = commands[i]
+        if command == ("push", "constant", 1) and i + 1 < len(commands):
+            following = commands[i + 1]
+            if following[0] == "add" or following[0] == "sub":
+                fused.append(("inc",) if following[0] == "add" else ("dec",))
+                i += 2
+                continue
+            if following[0] == "push" and i + 2 < len(commands) and commands[i + 2][0] == "add":
+                fused.extend([following, ("inc",)])
+                i += 3
+                continue
+        fused.append(command)
+        i += 1
+    return fused
+
+# Forget the values that may change when the variable (segment, index) is written
+def forget_writes(stack: list, segment: str, index: int):
+    for (i, value) in enumerate(stack):
+        if value is None:
+            continue
+        if value == (segment, index) or (segment in heap_segments and value[0] in heap_segments):
+            stack[i] = None
+        elif segment == "pointer" and value[0] == ("this" if index == 0 else "that"):
+            stack[i] = None
+
+# pop S i; push S i -> dup; pop S i and push S i when S i is already on top of the stack -> dup
+# The model knows which variable each value near the top of the stack was loaded from, within a basic block
+def reuse_stack_top(commands):
+    optimized = []
+    # Variable each known value is equal to, the top of the stack last, None when it is not a variable
+    stack = []
+    i = 0
+    while i < len(commands):
+        command = commands[i]
+        match command[0]:
+            case "push":
+                variable = command[1:]
+                if command[1] in dup_segments and len(stack) != 0 and stack[-1] == variable:
+                    command = ("dup",)
+                stack.append(variable if variable[0] != "constant" else None)
+            case "pop":
+                variable = command[1:]
+                if len(stack) != 0:
+                    stack.pop()
+                forget_writes(stack, *variable)
+                if command[1] in dup_segments and i + 1 < len(commands) and commands[i + 1] == ("push", *variable):
+                    # The stored value stays on the stack as the pushed one
+                    optimized.extend([("dup",), command])
+                    stack.append(variable)
+                    i += 2
+                    continue
+            case "dup":
+                stack.append(stack[-1] if len(stack) != 0 else None)
+            case "call":
+                del stack[max(len(stack) - command[2], 0):]
+                # The callee can write statics, temp and the heap, but not the locals and arguments of this call
+                stack = [value if value is not None and (value[0] == "local" or value[0] == "argument") else None for value in stack]
+                stack.append(None)
+            case "label" | "goto" | "function" | "return":
+                # Other paths join at a label, nothing is known about them
+                stack = []
+            case _:
+                (pops, pushes) = stack_effects[command[0]]
+                del stack[max(len(stack) - pops, 0):]
+                stack.extend([None] * pushes)
+        optimized.append(command)
+        i += 1
+    return optimized
+
+def optimize(commands: list) -> list:
+    return reuse_stack_top(fuse_increments(commands))
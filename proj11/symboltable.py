@@ -1,9 +1,21 @@
 from language import ValType
 
+# Everything known about a name, a lookup returns the whole record at once
+class Symbol:
+    __slots__ = ("name", "type", "kind", "index")
+
+    def __init__(self, name: str, type: str, kind: str, index: int):
+        self.name = name
+        self.type = type
+        self.kind = kind
+        self.index = index
+
 class SymbolTable:
     def __init__(self):
-        self.__class_symbols = []
-        self.__subroutine_symbols = []
+        # name -> Symbol for each scope
+        self.__class_symbols = {}
+        self.__subroutine_symbols = {}
+        # Symbols defined of each kind, also the index of the next one
         self.__index = {
             "arg": 0,
             "static": 0,
@@ -12,66 +24,43 @@ class SymbolTable:
         }
 
     def start_subroutine(self):
-        self.__subroutine_symbols = []
-        self.__index["static"] = 0
-        self.__index["field"] = 0
+        self.__subroutine_symbols = {}
         self.__index["var"] = 0
         self.__index["arg"] = 0
 
     def define(self, name: str, type: str, kind: str) -> int:
         match kind:
-            case "static":
-                self.__class_symbols.append((name, type, kind, self.__index["static"]))
-                self.__index["static"] += 1
-            case "field":
-                self.__class_symbols.append((name, type, kind, self.__index["field"]))
-                self.__index["field"] += 1
-            case "var":
-                self.__subroutine_symbols.append((name, type, kind, self.__index["var"]))
-                self.__index["var"] += 1
-            case "arg":
-                self.__subroutine_symbols.append((name, type, kind, self.__index["arg"]))
-                self.__index["arg"] += 1
+            case "static" | "field":
+                scope = self.__class_symbols
+            case "var" | "arg":
+                scope = self.__subroutine_symbols
             case _:
                 raise Exception("Invalid kind")
+        index = self.__index[kind]
+        self.__index[kind] += 1
+        # The first definition of a name in a scope is the one that is looked up
+        if name not in scope:
+            scope[name] = Symbol(name, type, kind, index)
+        return index
 
     def var_count(self, kind: str) -> int:
-        occurrences = 0
-        # Counting occurrences in subroutine
-        for (_, _, k, _) in self.__subroutine_symbols:
-            if k == kind:
-                occurrences += 1
-        # Counting occurrences in class
-        for (_, _, k, _) in self.__class_symbols:
-            if k == kind:
-                occurrences += 1
-        
-        return occurrences
+        return self.__index[kind]
+
+    # Symbol a name refers to, subroutine scope first, None if it is not defined
+    def lookup(self, name: str) -> Symbol | None:
+        symbol = self.__subroutine_symbols.get(name)
+        if symbol is None:
+            symbol = self.__class_symbols.get(name)
+        return symbol
 
     def kind_of(self, name: str) -> str | None:
-        for (ident, _, kind, _) in self.__subroutine_symbols:
-            if ident == name:
-                return kind
-        for (ident, _, kind, _) in self.__class_symbols:
-            if ident == name:
-                return kind
-        return None
+        symbol = self.lookup(name)
+        return symbol.kind if symbol is not None else None
 
     def type_of(self, name: str) -> str | None:
-        for (ident, type, _, _) in self.__subroutine_symbols:
-            if ident == name:
-                return type
-        for (ident, type, _, _) in self.__class_symbols:
-            if ident == name:
-                return type
-        return None
+        symbol = self.lookup(name)
+        return symbol.type if symbol is not None else None
 
     def index_of(self, name: str) -> int:
-        for (ident, _, _, idx) in self.__subroutine_symbols:
-            if ident == name:
-                return idx
-        for (ident, _, _, idx) in self.__class_symbols:
-            if ident == name:
-                return idx 
-        # return self.__curr_index
-        return None
\ No newline at end of file
+        symbol = self.lookup(name)
+        return symbol.index if symbol is not None else None
@@ -0,0 +1,151 @@
+# Syntax tree of a Jack class, JackParser builds it and the XML and VM code passes read it
+# Node names follow the tags of the parse tree XML
+
+# Class
+
+class ClassVarDec:
+    __slots__ = ("kind", "type", "names")
+
+    def __init__(self, kind: str, type: str, names: list):
+        # static or field
+        self.kind = kind
+        self.type = type
+        self.names = names
+
+class Parameter:
+    __slots__ = ("type", "name")
+
+    def __init__(self, type: str, name: str):
+        self.type = type
+        self.name = name
+
+class VarDec:
+    __slots__ = ("type", "names")
+
+    def __init__(self, type: str, names: list):
+        self.type = type
+        self.names = names
+
+class SubroutineDec:
+    __slots__ = ("kind", "return_type", "name", "parameters", "var_decs", "statements")
+
+    def __init__(self, kind: str, return_type: str, name: str, parameters: list, var_decs: list, statements: list):
+        # constructor, function or method
+        self.kind = kind
+        self.return_type = return_type
+        self.name = name
+        self.parameters = parameters
+        self.var_decs = var_decs
+        self.statements = statements
+
+class ClassDec:
+    __slots__ = ("name", "class_var_decs", "subroutines")
+
+    def __init__(self, name: str, class_var_decs: list, subroutines: list):
+        self.name = name
+        self.class_var_decs = class_var_decs
+        self.subroutines = subroutines
+
+# Statements
+
+class LetStatement:
+    __slots__ = ("name", "index", "value")
+
+    def __init__(self, name: str, index: "Expression | None", value: "Expression"):
+        self.name = name
+        # Expression inside [] when an array element is assigned
+        self.index = index
+        self.value = value
+
+class IfStatement:
+    __slots__ = ("condition", "statements", "else_statements")
+
+    def __init__(self, condition: "Expression", statements: list, else_statements: list | None):
+        self.condition = condition
+        self.statements = statements
+        # None when there is no else, an empty list for else {}
+        self.else_statements = else_statements
+
+class WhileStatement:
+    __slots__ = ("condition", "statements")
+
+    def __init__(self, condition: "Expression", statements: list):
+        self.condition = condition
+        self.statements = statements
+
+class DoStatement:
+    __slots__ = ("call",)
+
+    def __init__(self, call: "SubroutineCall"):
+        self.call = call
+
+class ReturnStatement:
+    __slots__ = ("value",)
+
+    def __init__(self, value: "Expression | None"):
+        self.value = value
+
+# Expressions
+
+# terms[0] ops[0] terms[1] ops[1] terms[2] ..., evaluated left to right without precedence
+class Expression:
+    __slots__ = ("terms", "ops")
+
+    def __init__(self, terms: list, ops: list):
+        self.terms = terms
+        self.ops = ops
+
+class IntegerConstant:
+    __slots__ = ("value",)
+
+    def __init__(self, value: int):
+        self.value = value
+
+class StringConstant:
+    __slots__ = ("value",)
+
+    def __init__(self, value: str):
+        self.value = value
+
+# true, false, null or this
+class KeywordConstant:
+    __slots__ = ("keyword",)
+
+    def __init__(self, keyword: str):
+        self.keyword = keyword
+
+class VarRef:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+class ArrayRef:
+    __slots__ = ("name", "index")
+
+    def __init__(self, name: str, index: Expression):
+        self.name = name
+        self.index = index
+
+# receiver is the class or variable before the dot, None for a subroutine of this class
+class SubroutineCall:
+    __slots__ = ("receiver", "name", "arguments")
+
+    def __init__(self, receiver: str | None, name: str, arguments: list):
+        self.receiver = receiver
+        self.name = name
+        self.arguments = arguments
+
+class ParenExpression:
+    __slots__ = ("expression",)
+
+    def __init__(self, expression: Expression):
+        self.expression = expression
+
+# - or ~ applied to a term
+class UnaryOp:
+    __slots__ = ("op", "term")
+
+    def __init__(self, op: str, term: object):
+        self.op = op
+        self.term = term
@@ -0,0 +1,38 @@
+import unittest
+
+from expression import Binary, Constant, Unary, fold, fold_binary
+
+# Constant folding must give the value the program computes on Hack, run with python -m unittest from this directory
+class FoldTest(unittest.TestCase):
+    def test_arithmetic_wraps_around(self):
+        self.assertEqual(fold_binary("add", 32767, 1), -32768)
+        self.assertEqual(fold_binary("sub", -32768, 1), 32767)
+        self.assertEqual(fold_binary("multiply", 300, 300), 24464)
+
+    def test_comparisons(self):
+        self.assertEqual(fold_binary("lt", 1, 2), -1)
+        self.assertEqual(fold_binary("gt", 1, 2), 0)
+        self.assertEqual(fold_binary("eq", 2, 2), -1)
+
+    # lt and gt jump on the sign of x - y, which wraps around like on the target
+    def test_comparisons_wrap_around(self):
+        self.assertEqual(fold_binary("lt", 20000, -20000), -1)
+        self.assertEqual(fold_binary("gt", 20000, -20000), 0)
+        self.assertEqual(fold_binary("gt", -20000, 20000), -1)
+        self.assertEqual(fold_binary("lt", -20000, 20000), 0)
+        # x - y wraps to -32768, which is not greater than zero
+        self.assertEqual(fold_binary("gt", 0, -32768), 0)
+        self.assertEqual(fold_binary("lt", 0, -32768), -1)
+
+    def test_fold_comparison_expression(self):
+        # (20000 < -20000)
+        folded = fold(Binary("lt", Constant(20000), Unary("neg", Constant(20000))))
+        self.assertIsInstance(folded, Constant)
+        self.assertEqual(folded.value, -1)
+
+    def test_divide_by_zero_is_not_folded(self):
+        self.assertIsNone(fold_binary("divide", 1, 0))
+        self.assertIsNone(fold_binary("divide", -32768, -1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from peephole import optimize, rules
+
+# One positive and one negative case for every peephole rule, run with python -m unittest from this directory
+class PeepholeTest(unittest.TestCase):
+    def test_push_pop(self):
+        commands = [("push", "local", 0), ("pop", "local", 0), ("return",)]
+        self.assertEqual(optimize(commands, ["push-pop"]), [("return",)])
+
+    def test_push_pop_other_slot(self):
+        commands = [("push", "local", 0), ("pop", "local", 1), ("push", "local", 1), ("pop", "argument", 1)]
+        self.assertEqual(optimize(commands, ["push-pop"]), commands)
+
+    def test_double_negation(self):
+        commands = [("push", "local", 0), ("not",), ("not",), ("neg",), ("neg",), ("pop", "local", 1)]
+        self.assertEqual(optimize(commands, ["double-negation"]), [("push", "local", 0), ("pop", "local", 1)])
+
+    def test_mixed_negation(self):
+        commands = [("push", "local", 0), ("not",), ("neg",), ("pop", "local", 1)]
+        self.assertEqual(optimize(commands, ["double-negation"]), commands)
+
+    def test_invert_branch(self):
+        commands = [
+            ("push", "local", 0), ("push", "constant", 0), ("lt",), ("not",),
+            ("if-goto", "IF_TRUE0"), ("goto", "IF_FALSE0"), ("label", "IF_TRUE0"),
+        ]
+        self.assertEqual(optimize(commands, ["invert-branch"]), [
+            ("push", "local", 0), ("push", "constant", 0), ("lt",),
+            ("if-goto", "IF_FALSE0"), ("label", "IF_TRUE0"),
+        ])
+
+    # not only inverts true and false, after anything but a comparison the branch must stay as it is
+    def test_invert_branch_after_other_value(self):
+        commands = [
+            ("push", "local", 0), ("push", "constant", 1), ("and",), ("not",),
+            ("if-goto", "IF_TRUE0"), ("goto", "IF_FALSE0"), ("label", "IF_TRUE0"),
+        ]
+        self.assertEqual(optimize(commands, ["invert-branch"]), commands)
+
+    def test_constant_branch(self):
+        # while (true) and while (false)
+        commands = [
+            ("label", "WHILE_EXP0"), ("push", "constant", 1), ("neg",), ("not",), ("if-goto", "WHILE_END0"),
+            ("push", "constant", 0), ("not",), ("if-goto", "WHILE_END1"),
+        ]
+        self.assertEqual(optimize(commands, ["constant-branch"]), [("label", "WHILE_EXP0"), ("goto", "WHILE_END1")])
+
+    def test_constant_branch_on_variable(self):
+        commands = [("push", "local", 0), ("not",), ("if-goto", "WHILE_END0")]
+        self.assertEqual(optimize(commands, ["constant-branch"]), commands)
+
+    def test_array_store(self):
+        commands = [
+            ("push", "local", 1), ("pop", "temp", 0), ("pop", "pointer", 1), ("push", "temp", 0), ("pop", "that", 0),
+        ]
+        self.assertEqual(optimize(commands, ["array-store"]), [
+            ("pop", "pointer", 1), ("push", "local", 1), ("pop", "that", 0),
+        ])
+
+    # The pushed value would be read through the new THAT
+    def test_array_store_of_that(self):
+        commands = [
+            ("push", "that", 0), ("pop", "temp", 0), ("pop", "pointer", 1), ("push", "temp", 0), ("pop", "that", 0),
+        ]
+        self.assertEqual(optimize(commands, ["array-store"]), commands)
+
+    # A jump can land between the commands around a label, so no rule rewrites across it
+    def test_no_window_spans_label(self):
+        commands = [
+            ("push", "local", 0), ("label", "L1"), ("pop", "local", 0),
+            ("not",), ("label", "L2"), ("not",),
+            ("push", "constant", 1), ("label", "L3"), ("if-goto", "L1"),
+        ]
+        self.assertEqual(optimize(commands, list(rules)), commands)
+
+    def test_unknown_rule(self):
+        with self.assertRaises(Exception):
+            optimize([], ["no-such-rule"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import io
+import os
+import tempfile
+import unittest
+
+from language import TokenType
+from tokenizer import JackTokenizer, stream_tokens, STRING_CODE
+
+# Jack string constants have no escapes, a backslash is an ordinary character, run with python -m unittest
+source = 'class Main { function void main() { do Output.printString("C:\\"); do Output.printString("a\\\\b"); return; } }\n'
+
+class StringConstantTest(unittest.TestCase):
+    def test_backslash_in_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "Main.jack")
+            with open(path, "w") as f:
+                f.write(source)
+            tokenizer = JackTokenizer(path)
+            strings = []
+            while tokenizer.has_more_tokens():
+                if tokenizer.token_type() == TokenType.STRING_CONST:
+                    strings.append(tokenizer.string_val())
+                tokenizer.advance()
+        self.assertEqual(strings, ["C:\\", "a\\\\b"])
+
+    def test_backslash_in_stream(self):
+        # Small chunks so the strings are split across them
+        tokens = list(stream_tokens(io.StringIO(source), chunk_size=7))
+        self.assertEqual([value for (code, value, _, _) in tokens if code == STRING_CODE], ["C:\\", "a\\\\b"])
+
+    def test_unterminated_string(self):
+        with self.assertRaisesRegex(Exception, "Unterminated string at 1:7"):
+            list(stream_tokens(io.StringIO('let s="C:\\;\n')))
+
+if __name__ == "__main__":
+    unittest.main()
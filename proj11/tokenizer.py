@@ -1,197 +1,346 @@
 import re
-from language import keywords, Keyword, TokenType, symbols
+from array import array
+from collections import deque
+from language import keyword_lookup, Keyword, TokenType
+
+# Master pattern for a single pass over the whole source buffer
+# Each match skips leading whitespace and then matches exactly one of the groups below, lastindex tells which one
+token_pattern = re.compile(r"""
+    \s*
+    (?:
+      (//[^\n]*|/\*.*?\*/)
+    | ([a-zA-Z_][a-zA-Z0-9_]*)
+    | ([{}()\[\].,;+\-*&|<>=~]|/(?!\*))
+    | ([0-9]+)
+    | "([^"\n]*)"
+    | (\S)
+    )
+""", re.VERBOSE | re.DOTALL)
+COMMENT_GROUP = 1
+WORD_GROUP = 2
+SYMBOL_GROUP = 3
+INT_GROUP = 4
+STRING_GROUP = 5
+ERROR_GROUP = 6
+
+# Characters read at a time when streaming
+CHUNK_SIZE = 1 << 16
+# Tokens a stream keeps ahead of and behind the current one for peek and rewind
+STREAM_WINDOW = 8
+
+# Type code stored for every token, each keyword gets a code of its own so the Keyword enum is known without a lookup
+SYMBOL_CODE = 0
+IDENTIFIER_CODE = 1
+INT_CODE = 2
+STRING_CODE = 3
+keyword_codes = {word: 4 + i for (i, word) in enumerate(keyword_lookup)}
+# TokenType and Keyword for each type code
+code_token_types = (TokenType.SYMBOL, TokenType.IDENTIFIER, TokenType.INT_CONST, TokenType.STRING_CONST) + (TokenType.KEYWORD,) * len(keyword_codes)
+code_keywords = (None, None, None, None) + tuple(keyword_lookup.values())
+
+# Type code and value of a token matched by token_pattern, code is None when the match is an error
+def classify(group: int, value: str) -> (int | None, str | int):
+    if group == WORD_GROUP:
+        # Words are identifiers unless they are in the keyword table
+        return (keyword_codes.get(value, IDENTIFIER_CODE), value)
+    elif group == SYMBOL_GROUP:
+        return (SYMBOL_CODE, value)
+    elif group == INT_GROUP:
+        return (INT_CODE, int(value))
+    elif group == STRING_GROUP:
+        # Jack strings have no escapes, the quotes are already left out of the group
+        return (STRING_CODE, value)
+    return (None, value)
+
+def lex_error(value: str, line: int, column: int):
+    if value == "\"":
+        raise Exception(f"Unterminated string at {line}:{column}")
+    elif value == "/":
+        raise Exception(f"Unterminated comment at {line}:{column}")
+    else:
+        raise Exception(f"Unexpected character \"{value}\" at {line}:{column}")
+
+# Line and column (1-based) of an offset into the source buffer
+def line_column(source: str, offset: int) -> (int, int):
+    line = source.count("\n", 0, offset) + 1
+    column = offset - source.rfind("\n", 0, offset)
+    return (line, column)
 
 class JackTokenizer:
     def __init__(self, file_path) -> None:
-        # Read in .jack file
+        # Read in .jack file and lex it in one pass
         with open(file_path) as f:
-            self.raw_code_lines = f.readlines()
-        # Clean code
-        # Remove comments
-        self.cleaned_code_lines = []
-        multi_line_comment = False
-        for code_line in self.raw_code_lines:
-            # Continuing multiline comment
-            # does not terminate in current line
-            if multi_line_comment and "*/" not in code_line:
+            self.source = f.read()
+
+        # Tokens are kept in parallel arrays instead of one object per token
+        # type code, offset and length of the token text in source, and index of the token value in values
+        self.token_codes = array("B")
+        self.token_offsets = array("I")
+        self.token_lengths = array("I")
+        self.token_values = array("I")
+        # Intern table, every distinct identifier/keyword/symbol/constant is stored once
+        self.values = []
+        self.__lex()
+
+        # Cursor into the token stream, the current token is at index position of the arrays
+        self.position = 0
+
+    def __lex(self):
+        source = self.source
+        value_indexes = {}
+        for match in token_pattern.finditer(source):
+            group = match.lastindex
+            if group == COMMENT_GROUP:
                 continue
-            # does terminate in current line
-            if multi_line_comment and "*/" in code_line:
-                remaining_line = code_line[code_line.index("*/") + 2:]
-                if len(remaining_line.strip()) != 0: self.cleaned_code_lines.append(remaining_line) 
-                multi_line_comment = False
-                code_line = code_line[code_line.index("*/") + 2:]
-            
-            code_line = code_line.replace("\n", "")
-            code_line = code_line.replace("\t", "")
-            if len(code_line) == 0: continue
-
-            # Comment at the beginning of the line
-            if "//" in code_line and code_line.index("//") == 0:
+            start = match.start(group)
+            value = match.group(group)
+
+            (code, value) = classify(group, value)
+            if code is None:
+                lex_error(value, *line_column(source, start))
+            if code == STRING_CODE:
+                # The token starts at the opening quote
+                start -= 1
+
+            value_index = value_indexes.get(value)
+            if value_index is None:
+                value_index = len(self.values)
+                value_indexes[value] = value_index
+                self.values.append(value)
+
+            self.token_codes.append(code)
+            self.token_offsets.append(start)
+            self.token_lengths.append(match.end() - start)
+            self.token_values.append(value_index)
+
+    def has_more_tokens(self) -> bool:
+        return self.position < len(self.token_codes)
+
+    def advance(self) -> str:
+        value = self.values[self.token_values[self.position]]
+        self.position += 1
+        return value
+
+    def curr_token(self) -> str:
+        return self.values[self.token_values[self.position]]
+
+    # Look k tokens past the current one without consuming anything
+    def peek(self, k: int = 1) -> str | None:
+        peek_position = self.position + k
+        if peek_position < len(self.token_codes):
+            return self.values[self.token_values[peek_position]]
+        return None
+
+    # Save the current position so the stream can be rewound to it later
+    def mark(self) -> int:
+        return self.position
+
+    def rewind(self, mark: int):
+        self.position = mark
+
+    # Line and column the current token starts at
+    def location(self) -> (int, int):
+        return line_column(self.source, self.token_offsets[self.position])
+
+    # Source text of the current token, quotes included for strings
+    def text(self) -> str:
+        offset = self.token_offsets[self.position]
+        return self.source[offset:offset + self.token_lengths[self.position]]
+
+    def token_type(self) -> TokenType:
+        # Tokens are classified once while lexing
+        return code_token_types[self.token_codes[self.position]]
+
+    def keyword(self) -> (Keyword, str):
+        keyword_type = code_keywords[self.token_codes[self.position]]
+        if keyword_type is None:
+            raise Exception(f"Invalid keyword \"{self.curr_token()}\"")
+        return (keyword_type, self.values[self.token_values[self.position]])
+
+    def symbol(self) -> str:
+        if self.token_codes[self.position] != SYMBOL_CODE:
+            raise Exception("Current token is not of type SYMBOL")
+        return self.values[self.token_values[self.position]]
+
+    def identifier(self) -> str:
+        if self.token_codes[self.position] != IDENTIFIER_CODE:
+            raise Exception("Current token is not of type IDENTIFIER")
+        return self.values[self.token_values[self.position]]
+
+    def int_val(self) -> int:
+        if self.token_codes[self.position] != INT_CODE:
+            raise Exception("Current token is not of type INT_CONST")
+        return self.values[self.token_values[self.position]]
+
+    def string_val(self) -> str:
+        if self.token_codes[self.position] != STRING_CODE:
+            raise Exception("Current token is not of type STRING_CONST")
+        return self.values[self.token_values[self.position]]
+
+# Line number and start offset of the line after the newlines in buffer[begin:end], base is the offset of buffer in the whole input
+def count_lines(buffer: str, begin: int, end: int, base: int, line: int, line_start: int) -> (int, int):
+    newlines = buffer.count("\n", begin, end)
+    if newlines == 0:
+        return (line, line_start)
+    return (line + newlines, base + buffer.rindex("\n", begin, end) + 1)
+
+# Lazily lex a file object chunk by chunk, yields (type code, value, line, column) for every token
+def stream_tokens(file, chunk_size: int = CHUNK_SIZE):
+    buffer = ""
+    position = 0
+    # Offset of buffer[0] in the whole input
+    base = 0
+    at_eof = False
+    line = 1
+    # Offset in the whole input where the current line starts
+    line_start = 0
+    # Location of a block comment that is not closed in the buffer yet, carried over to the next chunks
+    open_comment = None
+
+    while True:
+        if open_comment is not None:
+            end = buffer.find("*/", position)
+            if end != -1:
+                (line, line_start) = count_lines(buffer, position, end + 2, base, line, line_start)
+                position = end + 2
+                open_comment = None
                 continue
-            # Comment midway through the line
-            elif "//" in code_line:
-                prior_to_comment = code_line[:code_line.index("//")].strip()
-                if len(prior_to_comment) != 0: self.cleaned_code_lines.append(prior_to_comment) 
-            # Multiline comment
-            elif "/*" in code_line:
-                prior_to_multi_line_comment = code_line[:code_line.index("/*")]
-                if len(prior_to_multi_line_comment.strip()) != 0: self.cleaned_code_lines.append(prior_to_multi_line_comment)
-                multi_line_comment = True
-            else:
-                self.cleaned_code_lines.append(code_line.strip())
-            
-            # Continuing multiline comment
-            # does not terminate in current line
-            if multi_line_comment and "*/" not in code_line:
+            if at_eof:
+                lex_error("/", *open_comment)
+            # Keep the last character in case */ is split across two chunks
+            end = max(position, len(buffer) - 1)
+            (line, line_start) = count_lines(buffer, position, end, base, line, line_start)
+            position = end
+        else:
+            match = token_pattern.match(buffer, position)
+            if match is not None:
+                group = match.lastindex
+                start = match.start(group)
+
+            # A match that runs into the end of the buffer might continue in the next chunk
+            if at_eof or not (match is None or match.end() == len(buffer) or group == ERROR_GROUP):
+                if match is None:
+                    return
+                if group == COMMENT_GROUP:
+                    (line, line_start) = count_lines(buffer, position, match.end(), base, line, line_start)
+                    position = match.end()
+                    continue
+                (line, line_start) = count_lines(buffer, position, start, base, line, line_start)
+                position = match.end()
+
+                (code, value) = classify(group, match.group(group))
+                column = base + start - line_start + 1
+                if code is None:
+                    lex_error(value, line, column)
+                if code == STRING_CODE:
+                    # The token starts at the opening quote
+                    column -= 1
+                yield (code, value, line, column)
                 continue
-            # does terminate in current line
-            if multi_line_comment and "*/" in code_line:
-                remaining_line = code_line[code_line.index("*/") + 2:]
-                if len(remaining_line.strip()) != 0: self.cleaned_code_lines.append(remaining_line) 
-                multi_line_comment = False
+
+            if match is not None and group == ERROR_GROUP and buffer.startswith("/*", start):
+                # Block comment that is not closed yet, skip it as chunks come in instead of rescanning it
+                (line, line_start) = count_lines(buffer, position, start, base, line, line_start)
+                open_comment = (line, base + start - line_start + 1)
+                position = start + 2
                 continue
 
-        # Tokens
-        self.tokens = []
-        for line in self.cleaned_code_lines:
-            if len(line) == 0: continue
-            split_line = []
-            # Detecting if any strings are present
-            if "\"" in line and "\\\"" not in line:
-                split_line = line.split("\"")
-                split_line[1] = "\"" + split_line[1] + "\""
-            else:
-                split_line.append(line)
-            # Removed whitespaces ande extract any symbols that are grouped along in the same token
-            for s in split_line:
-                if s[0] == "\"" and s[len(s) - 1] == "\"":
-                    self.tokens.append(s) 
-                    continue
-                for token in s.split(" "):
-                    # Handling strings
-                    # Check if any symbols are present in the current token
-                    symbols_present = []
-                    for c in token:
-                        if c in symbols:
-                            symbols_present.append(c)
-                    # Handling when symbols are present 
-                    if len(symbols_present) != 0:
-                        seperated_tokens = []
-                        for s in symbols_present:
-                            # first part before symbol
-                            beg = token[:token.index(s)]
-                            if len(beg) != 0: seperated_tokens.append(beg)
-                            # symbol
-                            seperated_tokens.append(s)
-                            # remaining part of the symbol
-                            token = token[token.index(s) + 1:]
-                        if len(token) != 0: seperated_tokens.append(token)
-                        self.tokens.extend(seperated_tokens)
-                    else:
-                        self.tokens.append(token)
-            
-        self.tokens = list(filter(lambda x: x.strip() != "", self.tokens))
+        # Drop what has been consumed and read the next chunk
+        chunk = file.read(chunk_size)
+        at_eof = len(chunk) == 0
+        base += position
+        buffer = buffer[position:] + chunk
+        position = 0
+
+# Same interface as JackTokenizer for input that is lexed lazily while it is parsed (stdin, pipes, huge files)
+# Only STREAM_WINDOW tokens ahead of and behind the current one are kept, so memory does not grow with the input
+class JackTokenStream:
+    def __init__(self, file, chunk_size: int = CHUNK_SIZE) -> None:
+        self.tokens = stream_tokens(file, chunk_size)
+        # (type code, value, line, column) tokens, window[0] is token number window_start of the stream
+        self.window = deque()
+        self.window_start = 0
+        self.position = 0
+
+    # Lex until the token k past the current one is in the window, False if the input ends first
+    def __fill(self, k: int) -> bool:
+        while self.window_start + len(self.window) <= self.position + k:
+            token = next(self.tokens, None)
+            if token is None:
+                return False
+            self.window.append(token)
+        return True
+
+    def __current(self) -> tuple:
+        self.__fill(0)
+        return self.window[self.position - self.window_start]
 
     def has_more_tokens(self) -> bool:
-        return len(self.tokens) != 0
+        return self.__fill(0)
 
     def advance(self) -> str:
-        return self.tokens.pop(0)
-    
+        value = self.__current()[1]
+        self.position += 1
+        # Forget tokens that are too far behind to be rewound to
+        while self.position - self.window_start > STREAM_WINDOW:
+            self.window.popleft()
+            self.window_start += 1
+        return value
+
     def curr_token(self) -> str:
-        return self.tokens[0]
+        return self.__current()[1]
+
+    # Look k tokens past the current one without consuming anything
+    def peek(self, k: int = 1) -> str | None:
+        if k > STREAM_WINDOW:
+            raise Exception(f"Cannot peek more than {STREAM_WINDOW} tokens ahead in a stream")
+        if not self.__fill(k):
+            return None
+        return self.window[self.position - self.window_start + k][1]
+
+    # Save the current position so the stream can be rewound to it later
+    def mark(self) -> int:
+        return self.position
+
+    def rewind(self, mark: int):
+        if mark < self.window_start:
+            raise Exception(f"Cannot rewind more than {STREAM_WINDOW} tokens in a stream")
+        self.position = mark
+
+    # Line and column the current token starts at
+    def location(self) -> (int, int):
+        (_, _, line, column) = self.__current()
+        return (line, column)
 
     def token_type(self) -> TokenType:
-        curr_token = self.tokens[0].strip()
-
-        # Keyword or symbol checking
-        if curr_token in keywords:
-            return TokenType.KEYWORD
-        elif curr_token in symbols:
-            return TokenType.SYMBOL
-        # Literals
-        # regex: one or more characters in the range of 0-9
-        elif re.fullmatch("[0-9]+", curr_token):
-            return TokenType.INT_CONST
-        # regex: the first character must be an alphabetical character. Following characters can be zero or more alphabetical, numerical, or an underscore
-        elif re.fullmatch("^[a-zA-Z][a-zA-Z0-9_]*", curr_token):
-            return TokenType.IDENTIFIER
-        # regex: surrounding quotation marks and any character can be present within the string
-        elif re.fullmatch("\".*\"", curr_token):
-                return TokenType.STRING_CONST
-        else: 
-            raise Exception(f"No token type could be matched for {curr_token}")
+        return code_token_types[self.__current()[0]]
 
     def keyword(self) -> (Keyword, str):
-        keyword_type = None
-        match self.tokens[0]:
-            case "class":
-                keyword_type = Keyword.CLASS
-            case "constructor":
-                keyword_type = Keyword.CONSTRUCTOR
-            case "function":
-                keyword_type = Keyword.FUNCTION
-            case "method":
-                keyword_type = Keyword.METHOD
-            case "field":
-                keyword_type = Keyword.FIELD
-            case "static":
-                keyword_type = Keyword.STATIC
-            case "var":
-                keyword_type = Keyword.VAR
-            case "int":
-                keyword_type = Keyword.INT
-            case "char":
-                keyword_type = Keyword.CHAR
-            case "boolean":
-                keyword_type = Keyword.BOOLEAN
-            case "void":
-                keyword_type = Keyword.VOID
-            case "true":
-                keyword_type = Keyword.TRUE
-            case "false":
-                keyword_type = Keyword.FALSE
-            case "null":
-                keyword_type = Keyword.NULL
-            case "this":
-                keyword_type = Keyword.THIS
-            case "let":
-                keyword_type = Keyword.LET
-            case "if":
-                keyword_type = Keyword.IF
-            case "else":
-                keyword_type = Keyword.ELSE
-            case "while":
-                keyword_type = Keyword.WHILE
-            case "return":
-                keyword_type = Keyword.RETURN
-            case "do":
-                keyword_type = Keyword.DO
-            case _:
-                raise Exception(f"Invalid keyword \"{self.tokens[0]}\"")
-        return (keyword_type, self.tokens[0])
+        (code, value, _, _) = self.__current()
+        if code_keywords[code] is None:
+            raise Exception(f"Invalid keyword \"{value}\"")
+        return (code_keywords[code], value)
 
     def symbol(self) -> str:
-        if self.token_type() != TokenType.SYMBOL:
+        (code, value, _, _) = self.__current()
+        if code != SYMBOL_CODE:
             raise Exception("Current token is not of type SYMBOL")
-        else:
-            return self.tokens[0]
+        return value
 
     def identifier(self) -> str:
-        if self.token_type() != TokenType.IDENTIFIER:
+        (code, value, _, _) = self.__current()
+        if code != IDENTIFIER_CODE:
             raise Exception("Current token is not of type IDENTIFIER")
-        else:
-            return self.tokens[0]
+        return value
 
     def int_val(self) -> int:
-        if self.token_type() != TokenType.INT_CONST:
+        (code, value, _, _) = self.__current()
+        if code != INT_CODE:
             raise Exception("Current token is not of type INT_CONST")
-        else:
-            return self.tokens[0]
+        return value
 
     def string_val(self) -> str:
-        if self.token_type() != TokenType.STRING_CONST:
+        (code, value, _, _) = self.__current()
+        if code != STRING_CODE:
             raise Exception("Current token is not of type STRING_CONST")
-        else:
-            return self.tokens[0].replace("\"", "")
+        return value
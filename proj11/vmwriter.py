@@ -1,25 +1,38 @@
 import os
 
-class VMWriter:
-    def __init__(self, output_path):
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+# Line format of each opcode, labels and functions start at the beginning of the line and everything else is indented
+command_formats = {
+    "push": "    push %s %s\n",
+    "pop": "    pop %s %s\n",
+    "label": "label %s\n",
+    "goto": "    goto %s\n",
+    "if-goto": "    if-goto %s\n",
+    "call": "    call %s %s\n",
+    "function": "function %s %s\n",
+    "return": "    return\n",
+}
+for op in ("add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not", "dup", "inc", "dec"):
+    command_formats[op] = "    " + op + "\n"
 
-        self.output_file = open(output_path, "w")
-        self.output_lines = []
+class VMWriter:
+    # output is the path of the .vm file, any text stream (stdout, a pipe, io.StringIO) or an AsmWriter
+    def __init__(self, output):
+        self.output = output
+        # Commands as (opcode, args...) tuples, only formatted when the file is written
+        self.commands = []
 
     def write_push(self, segment, index: int):
-        self.output_lines.append("push {} {}".format(segment, index))
+        self.commands.append(("push", segment, index))
 
     def write_pop(self, segment, index: int):
-        self.output_lines.append("pop {} {}".format(segment, index))
+        self.commands.append(("pop", segment, index))
 
     def write_arithmetic(self, op):
-        self.output_lines.append(op)
+        self.commands.append((op,))
 
     def write_int(self, val):
         self.write_push("constant", val)
-    
+
     def write_string(self, string_to_write):
         self.write_int(len(string_to_write))
         self.write_call("String", "new", 1)
@@ -28,29 +41,40 @@ class VMWriter:
             self.write_call("String", "appendChar", 2)
 
     def write_label(self, label):
-        self.output_lines.append("label {}".format(label))
+        self.commands.append(("label", label))
 
     def write_goto(self, label):
-        self.output_lines.append("goto {}".format(label))
+        self.commands.append(("goto", label))
 
     def write_if(self, label):
-        self.output_lines.append("if-goto {}".format(label))
+        self.commands.append(("if-goto", label))
 
     def write_call(self, class_name, function_name, arg_c):
-        self.output_lines.append("call {}.{} {}".format(class_name, function_name, arg_c))
+        self.commands.append(("call", "{}.{}".format(class_name, function_name), arg_c))
 
     def write_function(self, class_name, func_name, local_var_count):
-        self.output_lines.append("function {}.{} {}".format(class_name, func_name, local_var_count))
+        self.commands.append(("function", "{}.{}".format(class_name, func_name), local_var_count))
 
     def write_return(self):
-        self.output_lines.append("return")
+        self.commands.append(("return",))
+
+    # VM code of all commands
+    def text(self) -> str:
+        formats = command_formats
+        return "".join([formats[command[0]] % command[1:] for command in self.commands])
 
+    # Write the whole file at once
     def write_vm_file(self):
-        for line in self.output_lines:
-            if "label" not in line and "function" not in line:
-                self.output_file.write("    " + line + "\n")
-            else:
-                self.output_file.write(line + "\n")
-        
-        self.output_file.write("")
-        self.output_file.close()
\ No newline at end of file
+        # An AsmWriter translates the commands to Hack assembly as they are, without VM code in between
+        if hasattr(self.output, "write_commands"):
+            self.output.write_commands(self.commands)
+            return
+        text = self.text()
+        if isinstance(self.output, str):
+            # Ensure directory exists
+            os.makedirs(os.path.dirname(self.output), exist_ok=True)
+            with open(self.output, "w") as output_file:
+                output_file.write(text)
+        else:
+            self.output.write(text)
+            self.output.flush()
@@ -0,0 +1,133 @@
+from syntaxtree import (ClassDec, LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement, Expression,
+                        ArrayRef, SubroutineCall, ParenExpression, UnaryOp)
+
+# Whole program compilation: every class of the program is parsed first, then only the subroutines Main.main can
+# reach are compiled. Jack has no dynamic dispatch, so the calls in the source decide exactly what can run
+
+# Subroutine the program starts in
+ENTRY_POINT = "Main.main"
+
+# Remove the statements after a return in statements and every block inside them, returns how many were removed
+def remove_dead_statements(statements: list) -> int:
+    removed = 0
+    for (i, statement) in enumerate(statements):
+        match statement:
+            case IfStatement():
+                removed += remove_dead_statements(statement.statements)
+                if statement.else_statements is not None:
+                    removed += remove_dead_statements(statement.else_statements)
+            case WhileStatement():
+                removed += remove_dead_statements(statement.statements)
+            case ReturnStatement():
+                removed += len(statements) - i - 1
+                del statements[i + 1:]
+                break
+    return removed
+
+def remove_dead_code(class_dec: ClassDec) -> int:
+    return sum(remove_dead_statements(subroutine.statements) for subroutine in class_dec.subroutines)
+
+# Every SubroutineCall in an expression, calls in the arguments of a call included
+def expression_calls(expression: Expression):
+    for term in expression.terms:
+        yield from term_calls(term)
+
+def term_calls(term):
+    match term:
+        case SubroutineCall():
+            yield term
+            for argument in term.arguments:
+                yield from expression_calls(argument)
+        case ArrayRef():
+            yield from expression_calls(term.index)
+        case ParenExpression():
+            yield from expression_calls(term.expression)
+        case UnaryOp():
+            yield from term_calls(term.term)
+
+def statement_calls(statements: list):
+    for statement in statements:
+        match statement:
+            case LetStatement():
+                if statement.index is not None:
+                    yield from expression_calls(statement.index)
+                yield from expression_calls(statement.value)
+            case IfStatement():
+                yield from expression_calls(statement.condition)
+                yield from statement_calls(statement.statements)
+                if statement.else_statements is not None:
+                    yield from statement_calls(statement.else_statements)
+            case WhileStatement():
+                yield from expression_calls(statement.condition)
+                yield from statement_calls(statement.statements)
+            case DoStatement():
+                yield from term_calls(statement.call)
+            case ReturnStatement():
+                if statement.value is not None:
+                    yield from expression_calls(statement.value)
+
+# Full names (Class.name) of the subroutines a subroutine calls, resolved like CompilationEngine.compile_call
+def called_subroutines(class_dec: ClassDec, subroutine, class_types: dict) -> set:
+    # Types of the variables in the subroutine's scope, the first definition of a name wins like in SymbolTable
+    types = {}
+    for parameter in subroutine.parameters:
+        types.setdefault(parameter.name, parameter.type)
+    for var_dec in subroutine.var_decs:
+        for name in var_dec.names:
+            types.setdefault(name, var_dec.type)
+
+    called = set()
+    for call in statement_calls(subroutine.statements):
+        if call.receiver is None:
+            called.add(f"{class_dec.name}.{call.name}")
+        else:
+            receiver_type = types.get(call.receiver, class_types.get(call.receiver))
+            called.add(f"{receiver_type if receiver_type is not None else call.receiver}.{call.name}")
+    return called
+
+# Full names of the subroutines Main.main reaches through calls, calls to classes outside the program (the OS) end there
+def reachable_subroutines(class_decs: list) -> set:
+    subroutines = {}
+    for class_dec in class_decs:
+        class_types = {}
+        for class_var_dec in class_dec.class_var_decs:
+            for name in class_var_dec.names:
+                class_types.setdefault(name, class_var_dec.type)
+        for subroutine in class_dec.subroutines:
+            subroutines[f"{class_dec.name}.{subroutine.name}"] = (class_dec, subroutine, class_types)
+    if ENTRY_POINT not in subroutines:
+        raise Exception(f"Whole program mode needs {ENTRY_POINT}, the program starts there")
+
+    reachable = {ENTRY_POINT}
+    pending = [ENTRY_POINT]
+    while len(pending) != 0:
+        for called in called_subroutines(*subroutines[pending.pop()]):
+            if called in subroutines and called not in reachable:
+                reachable.add(called)
+                pending.append(called)
+    return reachable
+
+# Number of VM commands, labels take no room in ROM
+def vm_size(commands: list) -> int:
+    return sum(1 for command in commands if command[0] != "label")
+
+# Table of what was removed from each class, rows are
+# (class name, subroutine names, removed subroutine names, statements after return, calls inlined, VM commands before, VM commands after)
+def size_report(rows: list) -> str:
+    lines = [f"{'class':<20} {'subroutines':>11} {'VM commands':>17}  removed"]
+    totals = [0, 0, 0, 0]
+    for (class_name, subroutine_names, removed_names, dead_statements, inlined_calls, size_before, size_after) in rows:
+        removed = list(removed_names)
+        if dead_statements != 0:
+            removed.append(f"{dead_statements} statement{'s' if dead_statements != 1 else ''} after return")
+        if inlined_calls != 0:
+            removed.append(f"{inlined_calls} call{'s' if inlined_calls != 1 else ''} inlined")
+        kept = len(subroutine_names) - len(removed_names)
+        lines.append(f"{class_name:<20} {kept:>4} of {len(subroutine_names):<3} {size_before:>7} -> {size_after:<7}  {', '.join(removed)}")
+        totals[0] += kept
+        totals[1] += len(subroutine_names)
+        totals[2] += size_before
+        totals[3] += size_after
+    saved = totals[2] - totals[3]
+    lines.append(f"{'total':<20} {totals[0]:>4} of {totals[1]:<3} {totals[2]:>7} -> {totals[3]:<7}  {saved} VM commands")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,212 @@
+import os
+from language import primitive_types
+from syntaxtree import (ClassDec, SubroutineDec, LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement,
+                        Expression, IntegerConstant, StringConstant, KeywordConstant, VarRef, ArrayRef,
+                        SubroutineCall, ParenExpression, UnaryOp)
+
+# Receives the parse tree of a class from emit_class
+# The base listener ignores everything
+class ParseListener:
+    # A nonterminal (class, letStatement, expression, ...) starts
+    def open(self, tag: str):
+        pass
+
+    # The most recently opened nonterminal ends
+    def close(self):
+        pass
+
+    # A terminal inside the current nonterminal
+    def token(self, tag: str, value: str):
+        pass
+
+# Characters escaped in the text of an element
+xml_escapes = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+# Writes the parse tree as the .xml output, one element per line indented with tabs
+# Lines are written as the events arrive, in the layout xml.etree.ElementTree.indent gives a tree
+class XmlWriter(ParseListener):
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.lines = []
+        # Tag and first line of the nonterminals that are open, innermost last
+        self.open_elements = []
+
+    def open(self, tag: str):
+        self.lines.append("\t" * len(self.open_elements) + "<" + tag + ">")
+        self.open_elements.append((tag, len(self.lines) - 1))
+
+    def close(self):
+        (tag, start) = self.open_elements.pop()
+        if start == len(self.lines) - 1:
+            # No children, the element is closed on the line it opened on
+            self.lines[start] += "</" + tag + ">"
+        else:
+            self.lines.append("\t" * len(self.open_elements) + "</" + tag + ">")
+
+    def token(self, tag: str, value: str):
+        self.lines.append("\t" * len(self.open_elements) + "<" + tag + ">" + value.translate(xml_escapes) + "</" + tag + ">")
+
+    def write_xml_file(self):
+        os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+        with open(self.output_path, "w", encoding="utf-8", errors="xmlcharrefreplace") as f:
+            f.write("\n".join(self.lines))
+
+# Parse tree pass over the syntax tree, drives a listener with the events of every nonterminal and terminal
+
+def emit_type(listener: ParseListener, type_name: str):
+    listener.token("keyword" if type_name in primitive_types else "identifier", type_name)
+
+# name, name, name
+def emit_names(listener: ParseListener, names: list):
+    listener.token("identifier", names[0])
+    for name in names[1:]:
+        listener.token("symbol", ",")
+        listener.token("identifier", name)
+
+def emit_class(class_dec: ClassDec, listener: ParseListener):
+    listener.open("class")
+    listener.token("keyword", "class")
+    listener.token("identifier", class_dec.name)
+    listener.token("symbol", "{")
+    for class_var_dec in class_dec.class_var_decs:
+        listener.open("classVarDec")
+        listener.token("keyword", class_var_dec.kind)
+        emit_type(listener, class_var_dec.type)
+        emit_names(listener, class_var_dec.names)
+        listener.token("symbol", ";")
+        listener.close()
+    for subroutine in class_dec.subroutines:
+        emit_subroutine(subroutine, listener)
+    listener.token("symbol", "}")
+    listener.close()
+
+def emit_subroutine(subroutine: SubroutineDec, listener: ParseListener):
+    listener.open("subroutineDec")
+    listener.token("keyword", subroutine.kind)
+    emit_type(listener, subroutine.return_type)
+    listener.token("identifier", subroutine.name)
+
+    listener.token("symbol", "(")
+    listener.open("parameterList")
+    for (i, parameter) in enumerate(subroutine.parameters):
+        if i != 0:
+            listener.token("symbol", ",")
+        emit_type(listener, parameter.type)
+        listener.token("identifier", parameter.name)
+    listener.close()
+    listener.token("symbol", ")")
+
+    listener.open("subroutineBody")
+    listener.token("symbol", "{")
+    for var_dec in subroutine.var_decs:
+        listener.open("varDec")
+        listener.token("keyword", "var")
+        emit_type(listener, var_dec.type)
+        emit_names(listener, var_dec.names)
+        listener.token("symbol", ";")
+        listener.close()
+    emit_statements(subroutine.statements, listener)
+    listener.token("symbol", "}")
+    listener.close()
+    listener.close()
+
+def emit_statements(statements: list, listener: ParseListener):
+    listener.open("statements")
+    for statement in statements:
+        match statement:
+            case LetStatement():
+                listener.open("letStatement")
+                listener.token("keyword", "let")
+                listener.token("identifier", statement.name)
+                if statement.index is not None:
+                    listener.token("symbol", "[")
+                    emit_expression(statement.index, listener)
+                    listener.token("symbol", "]")
+                listener.token("symbol", "=")
+                emit_expression(statement.value, listener)
+                listener.token("symbol", ";")
+            case IfStatement():
+                listener.open("ifStatement")
+                listener.token("keyword", "if")
+                emit_block(statement.condition, statement.statements, listener)
+                if statement.else_statements is not None:
+                    listener.token("keyword", "else")
+                    listener.token("symbol", "{")
+                    emit_statements(statement.else_statements, listener)
+                    listener.token("symbol", "}")
+            case WhileStatement():
+                listener.open("whileStatement")
+                listener.token("keyword", "while")
+                emit_block(statement.condition, statement.statements, listener)
+            case DoStatement():
+                listener.open("doStatement")
+                listener.token("keyword", "do")
+                emit_call(statement.call, listener)
+                listener.token("symbol", ";")
+            case ReturnStatement():
+                listener.open("returnStatement")
+                listener.token("keyword", "return")
+                if statement.value is not None:
+                    emit_expression(statement.value, listener)
+                listener.token("symbol", ";")
+        listener.close()
+    listener.close()
+
+# (condition) { statements } of an if or while
+def emit_block(condition: Expression, statements: list, listener: ParseListener):
+    listener.token("symbol", "(")
+    emit_expression(condition, listener)
+    listener.token("symbol", ")")
+    listener.token("symbol", "{")
+    emit_statements(statements, listener)
+    listener.token("symbol", "}")
+
+def emit_expression(expression: Expression, listener: ParseListener):
+    listener.open("expression")
+    terms = expression.terms
+    emit_term(terms[0], listener)
+    for (op, term) in zip(expression.ops, terms[1:]):
+        listener.token("symbol", op)
+        emit_term(term, listener)
+    listener.close()
+
+def emit_term(term, listener: ParseListener):
+    listener.open("term")
+    match term:
+        case IntegerConstant():
+            listener.token("integerConstant", str(term.value))
+        case StringConstant():
+            listener.token("stringConstant", term.value)
+        case KeywordConstant():
+            listener.token("keyword", term.keyword)
+        case VarRef():
+            listener.token("identifier", term.name)
+        case ArrayRef():
+            listener.token("identifier", term.name)
+            listener.token("symbol", "[")
+            emit_expression(term.index, listener)
+            listener.token("symbol", "]")
+        case SubroutineCall():
+            emit_call(term, listener)
+        case ParenExpression():
+            listener.token("symbol", "(")
+            emit_expression(term.expression, listener)
+            listener.token("symbol", ")")
+        case UnaryOp():
+            listener.token("symbol", term.op)
+            emit_term(term.term, listener)
+    listener.close()
+
+def emit_call(call: SubroutineCall, listener: ParseListener):
+    if call.receiver is not None:
+        listener.token("identifier", call.receiver)
+        listener.token("symbol", ".")
+    listener.token("identifier", call.name)
+    listener.token("symbol", "(")
+    listener.open("expressionList")
+    for (i, argument) in enumerate(call.arguments):
+        if i != 0:
+            listener.token("symbol", ",")
+        emit_expression(argument, listener)
+    listener.close()
+    listener.token("symbol", ")")
@@ -12,6 +12,58 @@ import os
 import sys
 
 
+# Command types, a parsed instruction stores the index of its type as its opcode.
+COMMAND_TYPES = ["C_ARITHMETIC", "C_PUSH", "C_POP", "C_LABEL", "C_GOTO", "C_IF", "C_FUNCTION", "C_CALL", "C_RETURN"]
+(C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IF, C_FUNCTION, C_CALL, C_RETURN) = range(len(COMMAND_TYPES))
+
+# Opcode of every VM command.
+OPCODES = {
+    "add": C_ARITHMETIC, "sub": C_ARITHMETIC, "neg": C_ARITHMETIC,
+    "eq": C_ARITHMETIC, "gt": C_ARITHMETIC, "lt": C_ARITHMETIC,
+    "and": C_ARITHMETIC, "or": C_ARITHMETIC, "not": C_ARITHMETIC,
+    "dup": C_ARITHMETIC, "inc": C_ARITHMETIC, "dec": C_ARITHMETIC,
+    "push": C_PUSH,
+    "pop": C_POP,
+    "label": C_LABEL,
+    "goto": C_GOTO,
+    "if-goto": C_IF,
+    "function": C_FUNCTION,
+    "call": C_CALL,
+    "return": C_RETURN,
+}
+
+
+def parse_command(parts) -> tuple:
+    """Turns the parts of a command, a split line or an (opcode, args...) tuple, into its instruction."""
+    opcode = OPCODES.get(parts[0])
+    if opcode is None:
+        raise NameError("Unexpected Command Type")
+    if opcode == C_ARITHMETIC:
+        return (opcode, sys.intern(parts[0]), None)
+    elif opcode == C_RETURN:
+        return (opcode, None, None)
+    elif opcode in [C_LABEL, C_GOTO, C_IF]:
+        return (opcode, sys.intern(parts[1]), None)
+    else:
+        return (opcode, sys.intern(parts[1]), int(parts[2]))
+
+
+def loop_commands(instructions: list) -> set:
+    """Finds the indices of the instructions inside a loop, between a label and a later jump back to it."""
+    loops = set()
+    # Labels of the current function and their indices.
+    labels = {}
+    for index, (opcode, arg1, _) in enumerate(instructions):
+        if opcode == C_FUNCTION:
+            labels = {}
+        elif opcode == C_LABEL:
+            labels[arg1] = index
+        elif opcode in [C_GOTO, C_IF] and arg1 in labels:
+            # A jump back to an earlier label closes a loop.
+            loops.update(range(labels[arg1], index + 1))
+    return loops
+
+
 class Parser:
     """Hack File Parser
 
@@ -19,13 +71,18 @@ class Parser:
     """
 
     def __init__(self, file_name: str):
-        """Opens the file and prepares for parsing."""
+        """Opens the file and parses every command once."""
         # Current command that's being processed.
         self.current_command = ""
+        # Current instruction that's being processed.
+        self.instruction = None
         # Current command index.
         self.current = -1
         # All commands from the input file.
         self.commands = []
+        # Instructions of the commands, (opcode, arg1, arg2) tuples with interned arguments.
+        # arg1 of C_ARITHMETIC is the command itself, missing arguments are None.
+        self.instructions = []
         # Open the file and prepare for parsing.
         # Remove all comments, empty lines, and whitespace characters.
         file = open(file_name)
@@ -34,7 +91,10 @@ class Parser:
             line = line.strip()
             if line:
                 self.commands.append(line)
+                self.instructions.append(parse_command(line.split()))
         file.close()
+        # Indices of the commands inside a loop.
+        self.loop_commands = None
 
     def hasMoreCommands(self) -> bool:
         """Checks if there are any more commands."""
@@ -44,46 +104,25 @@ class Parser:
         """Reads the next command and makes it the current command."""
         self.current += 1
         self.current_command = self.commands[self.current]
+        self.instruction = self.instructions[self.current]
 
     def commandType(self) -> str:
         """Returns the type of the current command."""
-        # Define the list of known arithmetic commands.
-        arithmetic_commands = ["add", "sub", "neg",
-                               "eq", "gt", "lt", "and", "or", "not"]
-        # Extract the current command from the input line.
-        cmd = self.current_command.split(" ")[0]
-        # Determine the type of the current command.
-        if cmd in arithmetic_commands:
-            return "C_ARITHMETIC"
-        elif cmd == "push":
-            return "C_PUSH"
-        elif cmd == "pop":
-            return "C_POP"
-        elif cmd == "label":
-            return "C_LABEL"
-        elif cmd == "goto":
-            return "C_GOTO"
-        elif cmd == "if-goto":
-            return "C_IF"
-        elif cmd == "function":
-            return "C_FUNCTION"
-        elif cmd == "call":
-            return "C_CALL"
-        elif cmd == "return":
-            return "C_RETURN"
-        else:
-            raise NameError("Unexpected Command Type")
+        return COMMAND_TYPES[self.instruction[0]]
+
+    def inLoop(self) -> bool:
+        """Checks if the current command is inside a loop, between a label and a later jump back to it."""
+        if self.loop_commands is None:
+            self.loop_commands = loop_commands(self.instructions)
+        return self.current in self.loop_commands
 
     def arg1(self) -> str:
         """Returns the first argument of the current command. For C_ARITHMETIC returns the command itself. Should not be called for C_RETURN."""
-        if self.commandType() == "C_ARITHMETIC":
-            return self.current_command.split(" ")[0]
-        else:
-            return self.current_command.split(" ")[1]
+        return self.instruction[1]
 
     def arg2(self) -> int:
-        """Returns the second argument of the current command. Only valid for C_PUSH, C_POP, C_FUNCTION, and C_RETURN."""
-        return int(self.current_command.split(" ")[2])
+        """Returns the second argument of the current command. Only valid for C_PUSH, C_POP, C_FUNCTION, and C_CALL."""
+        return self.instruction[2]
 
 
 class CodeWriter:
@@ -92,10 +131,26 @@ class CodeWriter:
     Converts the VM commands to assembly code and writes them into output file.
     """
 
-    def __init__(self, file_name: str):
-        """Setups the code converter for the given output file."""
-        # Open the output file for writing.
-        self.file = open(file_name, "w")
+    def __init__(self, file_name, shared_calls=False, comparisons="inline", cache_top=False):
+        """Setups the code converter for the given output file name or text stream.
+
+        With shared_calls every call jumps to one $$CALL routine and every return to one $$RETURN routine.
+        comparisons is "inline" to expand every eq, gt and lt, "shared" to jump to one $$EQ, $$GT and $$LT routine,
+        or "loops" to expand the comparisons inside loops and share the others.
+        With cache_top the value on top of the stack is kept in D within a basic block.
+        """
+        # Open the output file for writing, a stream is written as it is.
+        self.owns_file = isinstance(file_name, str)
+        self.file = open(file_name, "w") if self.owns_file else file_name
+        # Emit calls and returns through the shared routines written on close.
+        self.shared_calls = shared_calls
+        # Emit comparisons inline or through the shared routines written on close.
+        self.comparisons = comparisons
+        # Comparisons that jumped to a shared routine.
+        self.shared_comparisons = set()
+        # Keep the stack top in D, top_in_d tells if D holds it now and the stack in memory is one value short.
+        self.cache_top = cache_top
+        self.top_in_d = False
         # Store the file name for static label references.
         self.file_name = ""
         # Store the function name for label references.
@@ -103,6 +158,17 @@ class CodeWriter:
         # Create a label counter for unique label creation.
         self.label_counter = 0
         # Symbols table for arithmetic operations and assembly symbols.
+        # Writers of the command types, indexed by opcode, they take the arguments of an instruction and in_loop.
+        self.writers = [None] * len(COMMAND_TYPES)
+        self.writers[C_ARITHMETIC] = lambda command, _, in_loop: self.write_arithmetic(command, in_loop)
+        self.writers[C_PUSH] = lambda segment, index, _: self.write_push_pop("C_PUSH", segment, index)
+        self.writers[C_POP] = lambda segment, index, _: self.write_push_pop("C_POP", segment, index)
+        self.writers[C_LABEL] = lambda label, _, __: self.write_label(label)
+        self.writers[C_GOTO] = lambda label, _, __: self.write_goto(label)
+        self.writers[C_IF] = lambda label, _, __: self.write_if(label)
+        self.writers[C_FUNCTION] = lambda function_name, num_vars, _: self.write_function(function_name, num_vars)
+        self.writers[C_CALL] = lambda function_name, num_args, _: self.write_call(function_name, num_args)
+        self.writers[C_RETURN] = lambda _, __, ___: self.write_return()
         self.symbols = {
             # Arithmetic Operators
             "add": "M=D+M",
@@ -111,6 +177,8 @@ class CodeWriter:
             "or": "M=D|M",
             "neg": "M=-M",
             "not": "M=!M",
+            "inc": "M=M+1",
+            "dec": "M=M-1",
             "eq": "D;JEQ",
             "gt": "D;JGT",
             "lt": "D;JLT",
@@ -124,6 +192,24 @@ class CodeWriter:
             "pointer": "@3",
             "temp": "@5"
         }
+        # Largest indexes of local, argument, this and that reached by an A=M+1, A=A+1 chain from the base address.
+        # Up to them a chain is not longer than adding the index, for pops it also spares R13.
+        self.push_chain = 3
+        self.pop_chain = 7
+        # Arithmetic operators on the stack top cached in D, binary ones take the value below it from M.
+        self.d_symbols = {
+            "add": "D=D+M",
+            "sub": "D=M-D",
+            "and": "D=D&M",
+            "or": "D=D|M",
+            "neg": "D=-D",
+            "not": "D=!D",
+            "inc": "D=D+1",
+            "dec": "D=D-1",
+            "eq": "D;JEQ",
+            "gt": "D;JGT",
+            "lt": "D;JLT",
+        }
 
     def write_init(self):
         """Writes the VM bootstrap code."""
@@ -143,13 +229,37 @@ class CodeWriter:
         """Informs the codewriter about the file being processed."""
         self.file_name = file_name
 
+    def spill(self, output: list):
+        """Adds the code moving the stack top cached in D to the stack in memory."""
+        if self.top_in_d:
+            output.append("@SP")
+            output.append("AM=M+1")
+            output.append("A=A-1")
+            output.append("M=D")
+            self.top_in_d = False
+
+    def fill(self, output: list):
+        """Adds the code popping the stack top into D if it is not cached there."""
+        if not self.top_in_d:
+            output.append("@SP")
+            output.append("AM=M-1")
+            output.append("D=M")
+            self.top_in_d = True
+
     def comment(self, input: str):
         """Writes a comment with the given input."""
         self.write_to_file(["// " + input], False)
 
-    def write_arithmetic(self, command: str):
-        """Writes the assembly code for a given arithmetic vm command."""
+    def write_arithmetic(self, command: str, in_loop=False):
+        """Writes the assembly code for a given arithmetic vm command, in_loop tells if it is inside a loop."""
         output = []
+        # Comparisons outside the loops are shared with the "loops" option.
+        shared = self.comparisons == "shared" or (self.comparisons == "loops" and not in_loop)
+        if self.cache_top and not (command in ["eq", "gt", "lt"] and shared):
+            self.write_cached_arithmetic(command)
+            return
+        # The shared comparisons work on the stack in memory.
+        self.spill(output)
         if command in ["add", "sub", "and", "or"]:
             # Pop Stack into D.
             output.append("@SP")
@@ -160,11 +270,22 @@ class CodeWriter:
             output.append("A=M-1")
             # Use the Arithmetic Operator
             output.append(self.symbols[command])
-        elif command in ["neg", "not"]:
+        elif command in ["neg", "not", "inc", "dec"]:
             # Access to Stack[-1]
             output.append("@SP")
             output.append("A=M-1")
             output.append(self.symbols[command])
+        elif command in ["eq", "gt", "lt"] and shared:
+            return_label = "CompLabel" + str(self.label_counter)
+            self.label_counter += 1
+            self.shared_comparisons.add(command)
+            # D = return_label, goto the comparison routine.
+            output.append("@" + return_label)
+            output.append("D=A")
+            output.append("@$$" + command.upper())
+            output.append("0;JMP")
+            # (return_label)
+            output.append("(" + return_label + ")")
         elif command in ["eq", "gt", "lt"]:
             jump_label = "CompLabel" + str(self.label_counter)
             self.label_counter += 1
@@ -190,74 +311,197 @@ class CodeWriter:
             output.append("M=0")
             # Jump label for the True state.
             output.append("(" + jump_label + ")")
+        elif command == "dup":
+            # Put Stack[-1] into D.
+            output.append("@SP")
+            output.append("A=M-1")
+            output.append("D=M")
+            # Put D value into where SP points to.
+            output.append("A=A+1")
+            output.append("M=D")
+            # Increment the stack pointer.
+            output.append("@SP")
+            output.append("M=M+1")
         else:
             raise NameError("Unexpected Arithmetic Command")
 
         # Print assembly commands.
         self.write_to_file(output)
 
-    def write_push_pop(self, command: str, segment: str, index: int):
-        """Writes the push and pop code for a given vm command."""
+    def write_cached_arithmetic(self, command: str):
+        """Writes the assembly code for a given arithmetic vm command on the stack top cached in D."""
         output = []
-        if command == "C_PUSH":
-            if segment == "constant":
-                output.append("@" + str(index))
-                output.append("D=A")
+        if command in ["add", "sub", "and", "or"]:
+            # Pop the second value into A, the result stays in D.
+            self.fill(output)
+            output.append("@SP")
+            output.append("AM=M-1")
+            output.append(self.d_symbols[command])
+        elif command in ["neg", "not", "inc", "dec"]:
+            if self.top_in_d:
+                output.append(self.d_symbols[command])
+            else:
+                # Access to Stack[-1]
+                output.append("@SP")
+                output.append("A=M-1")
+                output.append(self.symbols[command])
+        elif command in ["eq", "gt", "lt"]:
+            jump_label = "CompLabel" + str(self.label_counter)
+            end_label = "CompEnd" + str(self.label_counter)
+            self.label_counter += 1
+            # Calculate the difference of the second value and D.
+            self.fill(output)
+            output.append("@SP")
+            output.append("AM=M-1")
+            output.append("D=M-D")
+            # Jump if the statement is True.
+            output.append("@" + jump_label)
+            output.append(self.d_symbols[command])
+            # Set D to False.
+            output.append("D=0")
+            output.append("@" + end_label)
+            output.append("0;JMP")
+            # Set D to True.
+            output.append("(" + jump_label + ")")
+            output.append("D=-1")
+            output.append("(" + end_label + ")")
+        elif command == "dup":
+            if self.top_in_d:
+                # Push a copy of D, the top stays in D.
                 output.append("@SP")
                 output.append("AM=M+1")
                 output.append("A=A-1")
                 output.append("M=D")
-            elif segment in ["local", "argument", "this", "that", "temp", "pointer"]:
-                # Put the index value into D.
+            else:
+                # Put Stack[-1] into D.
+                output.append("@SP")
+                output.append("A=M-1")
+                output.append("D=M")
+                self.top_in_d = True
+        else:
+            raise NameError("Unexpected Arithmetic Command")
+
+        # Print assembly commands.
+        self.write_to_file(output)
+
+    def segment_address(self, output: list, segment: str, index: int):
+        """Adds the code putting the address of the segment entry into A, D is left unchanged."""
+        if segment == "temp" or segment == "pointer":
+            output.append("@" + str(int(self.symbols[segment][1:]) + index))
+        elif segment == "static":
+            output.append("@" + self.file_name + "." + str(index))
+        else:
+            # Resolve where the segment refers to and step to the index.
+            output.append(self.symbols[segment])
+            if index == 0:
+                output.append("A=M")
+            else:
+                output.append("A=M+1")
+                for _ in range(index - 1):
+                    output.append("A=A+1")
+
+    def write_cached_push_pop(self, command: str, segment: str, index: int):
+        """Writes the push and pop code for a given vm command on the stack top cached in D."""
+        output = []
+        if command == "C_PUSH":
+            # The old top goes to memory, the pushed value is loaded into D.
+            self.spill(output)
+            if segment == "constant" and index in [0, 1, -1]:
+                output.append("D=" + str(index))
+            elif segment == "constant":
                 output.append("@" + str(index))
                 output.append("D=A")
-                # Put the base value into A.
-                if segment == "temp" or segment == "pointer":
-                    output.append(self.symbols[segment])
-                else:
-                    # Resolve where the segment refers to.
-                    output.append(self.symbols[segment])
-                    output.append("A=M")
-                # Calculate the source address into A.
+            elif segment in ["local", "argument", "this", "that"] and index > self.push_chain:
+                output.append(self.symbols[segment])
+                output.append("D=M")
+                output.append("@" + str(index))
                 output.append("A=D+A")
-                # Put the source value into D.
                 output.append("D=M")
-                # Put D value into where SP points to.
-                output.append("@SP")
-                output.append("A=M")
+            elif segment in ["local", "argument", "this", "that", "temp", "pointer", "static"]:
+                self.segment_address(output, segment, index)
+                output.append("D=M")
+            else:
+                raise NameError("Unexpected Push Segment")
+            self.top_in_d = True
+        elif command == "C_POP":
+            if segment == "constant":
+                # Not a valid command.
+                raise NameError("Cannot Pop Constant Segment")
+            self.fill(output)
+            if segment in ["local", "argument", "this", "that"] and index > self.pop_chain:
+                # Put D value into R13.
+                output.append("@R13")
+                output.append("M=D")
+                # Add the target address to D.
+                output.append(self.symbols[segment])
+                output.append("D=D+M")
+                output.append("@" + str(index))
+                output.append("D=D+A")
+                # Subtract R13 to get the target address into A, and A to get the value back.
+                output.append("@R13")
+                output.append("A=D-M")
+                output.append("M=D-A")
+            elif segment in ["local", "argument", "this", "that", "temp", "pointer", "static"]:
+                self.segment_address(output, segment, index)
                 output.append("M=D")
-                # Increment the stack pointer.
+            else:
+                raise NameError("Unexpected Pop Segment")
+            self.top_in_d = False
+        else:
+            raise NameError("Unexpected Command Type")
+
+        # Print assembly commands.
+        self.write_to_file(output)
+
+    def write_push_pop(self, command: str, segment: str, index: int):
+        """Writes the push and pop code for a given vm command."""
+        if self.cache_top:
+            self.write_cached_push_pop(command, segment, index)
+            return
+        output = []
+        if command == "C_PUSH":
+            if segment == "constant" and index in [0, 1, -1]:
+                # Write the constant straight into where SP points to.
                 output.append("@SP")
-                output.append("M=M+1")
-            elif segment == "static":
+                output.append("AM=M+1")
+                output.append("A=A-1")
+                output.append("M=" + str(index))
+                self.write_to_file(output)
+                return
+            elif segment == "constant":
+                output.append("@" + str(index))
+                output.append("D=A")
+            elif segment in ["local", "argument", "this", "that"] and index > self.push_chain:
+                # Put the base address into D.
+                output.append(self.symbols[segment])
+                output.append("D=M")
                 # Calculate the source address into A.
-                output.append("@" + self.file_name + "." + str(index))
+                output.append("@" + str(index))
+                output.append("A=D+A")
                 # Put the source value into D.
                 output.append("D=M")
-                # Put D value into where SP points to.
-                output.append("@SP")
-                output.append("A=M")
-                output.append("M=D")
-                # Increment the stack pointer.
-                output.append("@SP")
-                output.append("M=M+1")
+            elif segment in ["local", "argument", "this", "that", "temp", "pointer", "static"]:
+                # Put the source address into A and the source value into D.
+                self.segment_address(output, segment, index)
+                output.append("D=M")
             else:
                 raise NameError("Unexpected Push Segment")
+            # Put D value into where SP points to and increment the stack pointer.
+            output.append("@SP")
+            output.append("AM=M+1")
+            output.append("A=A-1")
+            output.append("M=D")
         elif command == "C_POP":
             if segment == "constant":
                 # Not a valid command.
                 raise NameError("Cannot Pop Constant Segment")
-            elif segment in ["local", "argument", "this", "that", "temp", "pointer"]:
+            elif segment in ["local", "argument", "this", "that"] and index > self.pop_chain:
                 # Put the index value into D.
                 output.append("@" + str(index))
                 output.append("D=A")
-                # Put the base value into A.
-                if segment == "temp" or segment == "pointer":
-                    output.append(self.symbols[segment])
-                else:
-                    # Resolve where the segment refers to.
-                    output.append(self.symbols[segment])
-                    output.append("A=M")
+                # Resolve where the segment refers to.
+                output.append(self.symbols[segment])
+                output.append("A=M")
                 # Calculate the source address into D.
                 output.append("D=D+A")
                 # Put D value into R13 for future use.
@@ -271,14 +515,13 @@ class CodeWriter:
                 output.append("@R13")
                 output.append("A=M")
                 output.append("M=D")
-            elif segment == "static":
+            elif segment in ["local", "argument", "this", "that", "temp", "pointer", "static"]:
                 # Pop stack value into D.
                 output.append("@SP")
                 output.append("AM=M-1")
                 output.append("D=M")
-                # Put the source address into A.
-                output.append("@" + self.file_name + "." + str(index))
-                # Put D value into static address.
+                # Put the target address into A without R13.
+                self.segment_address(output, segment, index)
                 output.append("M=D")
             else:
                 raise NameError("Unexpected Pop Segment")
@@ -292,6 +535,8 @@ class CodeWriter:
         """Writes the aseembly label."""
         label_name = self.function_name + "$" + label
         output = []
+        # Every path reaches a label with the stack top in memory.
+        self.spill(output)
         output.append("(" + label_name + ")")
         self.write_to_file(output)
 
@@ -299,6 +544,7 @@ class CodeWriter:
         """Writes unconditional jump to the given label."""
         label_name = self.function_name + "$" + label
         output = []
+        self.spill(output)
         output.append("@" + label_name)
         output.append("0;JMP")
         self.write_to_file(output)
@@ -307,10 +553,15 @@ class CodeWriter:
         """Writes conditional jump to the given label."""
         label_name = self.function_name + "$" + label
         output = []
-        # Pop stack value into D.
-        output.append("@SP")
-        output.append("AM=M-1")
-        output.append("D=M")
+        if self.cache_top:
+            # Pop stack value into D unless it is cached there.
+            self.fill(output)
+            self.top_in_d = False
+        else:
+            # Pop stack value into D.
+            output.append("@SP")
+            output.append("AM=M-1")
+            output.append("D=M")
         # Jump to label if D is True
         # (Not Equal to 0)
         output.append("@" + label_name)
@@ -321,10 +572,17 @@ class CodeWriter:
         """Writes the function definition in assembly."""
         output = []
         self.function_name = function_name
+        # A function is only entered by a call, with the stack top in memory.
+        self.top_in_d = False
         output.append("(" + self.function_name + ")")
         self.write_to_file(output)
         for _ in range(num_vars):
             self.write_push_pop("C_PUSH", "constant", 0)
+        # The local variables are read from memory.
+        output = []
+        self.spill(output)
+        if output:
+            self.write_to_file(output)
 
     def write_call(self, function_name: str, num_args: int):
         """Writes the necessary assembly code to call a function."""
@@ -333,6 +591,14 @@ class CodeWriter:
         # return_label = file_name.function_name$ret.i
         return_label = self.function_name + "$ret." + str(self.label_counter)
         self.label_counter += 1
+        # The arguments are read from memory.
+        output = []
+        self.spill(output)
+        if output:
+            self.write_to_file(output, new_line=False)
+        if self.shared_calls:
+            self.write_shared_call(function_name, num_args, return_label)
+            return
         # Output stream is initiated.
         output = []
         # push return_label
@@ -373,11 +639,117 @@ class CodeWriter:
         output.append("(" + return_label + ")")
         self.write_to_file(output)
 
+    def write_shared_call(self, function_name: str, num_args: int, return_label: str):
+        """Writes a call site that jumps to the shared $$CALL routine."""
+        output = []
+        # R13 = function_name
+        output.append("@" + function_name)
+        output.append("D=A")
+        output.append("@R13")
+        output.append("M=D")
+        # R14 = num_args
+        if num_args == 0 or num_args == 1:
+            output.append("@R14")
+            output.append("M=" + str(num_args))
+        else:
+            output.append("@" + str(num_args))
+            output.append("D=A")
+            output.append("@R14")
+            output.append("M=D")
+        # D = return_label, goto $$CALL
+        output.append("@" + return_label)
+        output.append("D=A")
+        output.append("@$$CALL")
+        output.append("0;JMP")
+        # (return_label)
+        output.append("(" + return_label + ")")
+        self.write_to_file(output)
+
+    def write_shared_routines(self):
+        """Writes the $$CALL and $$RETURN routines shared by every call and return."""
+        output = []
+        # $$CALL gets the function in R13, the number of arguments in R14 and the return address in D.
+        output.append("($$CALL)")
+        # push return_address
+        output.append("@SP")
+        output.append("AM=M+1")
+        output.append("A=A-1")
+        output.append("M=D")
+        # push LCL, ARG, THIS, and THAT
+        for segment in ["LCL", "ARG", "THIS", "THAT"]:
+            output.append("@" + segment)
+            output.append("D=M")
+            output.append("@SP")
+            output.append("AM=M+1")
+            output.append("A=A-1")
+            output.append("M=D")
+        # ARG = SP -5 -num_args
+        output.append("@R14")
+        output.append("D=M")
+        output.append("@5")
+        output.append("D=D+A")
+        output.append("@SP")
+        output.append("D=M-D")
+        output.append("@ARG")
+        output.append("M=D")
+        # LCL = SP
+        output.append("@SP")
+        output.append("D=M")
+        output.append("@LCL")
+        output.append("M=D")
+        # goto function
+        output.append("@R13")
+        output.append("A=M")
+        output.append("0;JMP")
+        self.write_to_file(output)
+        # $$RETURN is the return code every function jumps to.
+        self.write_to_file(["($$RETURN)"], new_line=False)
+        self.shared_calls = False
+        self.write_return()
+
+    def write_shared_comparison(self, command: str):
+        """Writes the shared routine of the given comparison, it gets the return address in D."""
+        routine = "$$" + command.upper()
+        output = []
+        output.append("(" + routine + ")")
+        # Store the return address in R15.
+        output.append("@R15")
+        output.append("M=D")
+        # Pop Stack into D.
+        output.append("@SP")
+        output.append("AM=M-1")
+        output.append("D=M")
+        # Access to Stack[-1]
+        output.append("A=A-1")
+        # Calculate the difference
+        output.append("D=M-D")
+        # Set the Stack to True in anticipation.
+        output.append("M=-1")
+        # Return if the statement is True.
+        output.append("@" + routine + "_RETURN")
+        output.append(self.symbols[command])
+        # Set the Stack[-1] to False
+        output.append("@SP")
+        output.append("A=M-1")
+        output.append("M=0")
+        # goto return_address
+        output.append("(" + routine + "_RETURN)")
+        output.append("@R15")
+        output.append("A=M")
+        output.append("0;JMP")
+        self.write_to_file(output)
+
     def write_return(self):
         """Writes the return code of a function call."""
         # Saves the return value and restores the previous call stack.
         # Output stream is initiated.
         output = []
+        self.spill(output)
+        if self.shared_calls:
+            output.append("@$$RETURN")
+            output.append("0;JMP")
+            self.write_to_file(output)
+            return
         # frame_end = LCL
         # Store frame_end in R13.
         output.append("@LCL")
@@ -416,32 +788,65 @@ class CodeWriter:
         output.append("0;JMP")
         self.write_to_file(output)
 
+    def write_instruction(self, opcode: int, arg1, arg2, in_loop=False):
+        """Writes the assembly code for a parsed instruction, in_loop tells if it is inside a loop."""
+        self.writers[opcode](arg1, arg2, in_loop)
+
+    def write_command(self, command: tuple, in_loop=False):
+        """Writes the assembly code for a vm command given as an (opcode, args...) tuple."""
+        # Write the command as a comment like the parsed commands.
+        self.comment(" ".join([str(part) for part in command]))
+        self.write_instruction(*parse_command(command), in_loop)
+
     def write_to_file(self, output: list, new_line=True):
         """Writes a given list of output."""
         # Add an empty line for debug purposes.
         if new_line:
             output.append("")
-        # Write every line to the output file.
-        for line in output:
-            print(line, file=self.file)
+        # Write every line to the output file at once.
+        self.file.write("\n".join(output) + "\n")
 
     def close(self):
-        """Closes the output file."""
-        self.file.close()
+        """Closes the output file, a stream is only flushed."""
+        # A program ending in the middle of a basic block leaves its stack top in memory.
+        output = []
+        self.spill(output)
+        if output:
+            self.write_to_file(output)
+        # The shared routines follow the code of every function.
+        if self.shared_calls:
+            self.comment("Shared Call and Return")
+            self.write_shared_routines()
+        for command in sorted(self.shared_comparisons):
+            self.comment("Shared " + command)
+            self.write_shared_comparison(command)
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
 
 
 def main():
     """Arranges the parsing and code conversion of a Virtual Machine file."""
 
+    # Separate the options from the input path.
+    options = [argument for argument in sys.argv[1:] if argument.startswith("--")]
+    paths = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
     # Check if an input file or a directory is given.
-    if len(sys.argv) != 2:
+    known_options = ["--shared-calls", "--cache-top", "--comparisons=inline", "--comparisons=shared", "--comparisons=loops"]
+    if len(paths) != 1 or any(option not in known_options for option in options):
         print("Error: No input file is found.")
-        print("Usage: python " + __file__ + " [file.vm] | [directory]")
+        print("Usage: python " + __file__ + " [--shared-calls] [--comparisons=inline|shared|loops] [--cache-top] [file.vm] | [directory]")
         return
+    # The last --comparisons option is used.
+    comparisons = "inline"
+    for option in options:
+        if option.startswith("--comparisons="):
+            comparisons = option.partition("=")[2]
 
     # Extract input files and setup the output file name.
     input_files = []
-    input_path = sys.argv[1]
+    input_path = paths[0]
     # File name is given.
     if os.path.isfile(input_path) and input_path[-3:] == ".vm":
         input_files.append(input_path)
@@ -463,7 +868,11 @@ def main():
         raise NameError("Unknown Input Path")
 
     # Create a code writer with the output file.
-    code_writer = CodeWriter(output_file_name)
+    # --shared-calls makes every call and return jump to one shared routine, a smaller but slower program.
+    # --comparisons=shared makes every eq, gt and lt jump to a shared routine, --comparisons=loops only the ones outside loops.
+    # --cache-top keeps the top of the stack in D within basic blocks.
+    code_writer = CodeWriter(output_file_name, shared_calls="--shared-calls" in options, comparisons=comparisons,
+                             cache_top="--cache-top" in options)
 
     # Insert the bootstrap code.
     code_writer.comment("Bootstrap Code")
@@ -483,41 +892,9 @@ def main():
             parser.advance()
             # Write the current command as a comment to the output file for debugging purposes.
             code_writer.comment(parser.current_command)
-            # Determine the current command type.
-            # C_ARITHMETIC, C_PUSH, or C_POP.
-            command_type = parser.commandType()
-            if command_type == "C_ARITHMETIC":
-                # Pass the arithmetic command to the code writer.
-                code_writer.write_arithmetic(parser.arg1())
-            elif command_type in ["C_PUSH", "C_POP"]:
-                # Pass the push/pop command to the code writer with its arguments.
-                segment = parser.arg1()
-                index = parser.arg2()
-                code_writer.write_push_pop(command_type, segment, index)
-            elif command_type == "C_LABEL":
-                # Define label.
-                code_writer.write_label(parser.arg1())
-            elif command_type == "C_GOTO":
-                # Unconditional jump to label.
-                code_writer.write_goto(parser.arg1())
-            elif command_type == "C_IF":
-                # Conditional jump to label.
-                code_writer.write_if(parser.arg1())
-            elif command_type == "C_FUNCTION":
-                # Define a function with number of variables.
-                function_name = parser.arg1()
-                num_vars = parser.arg2()
-                code_writer.write_function(function_name, num_vars)
-            elif command_type == "C_CALL":
-                # Call a function with number of arguments.
-                function_name = parser.arg1()
-                num_args = parser.arg2()
-                code_writer.write_call(function_name, num_args)
-            elif command_type == "C_RETURN":
-                # Return from the current function.
-                code_writer.write_return()
-            else:
-                raise NameError("Unsupported Command Type")
+            # Pass the instruction to the writer of its command type.
+            (opcode, arg1, arg2) = parser.instruction
+            code_writer.write_instruction(opcode, arg1, arg2, parser.inLoop())
 
     # Close the output file before exiting.
     code_writer.close()
@@ -0,0 +1,81 @@
+import io
+import unittest
+
+from p8 import CodeWriter
+
+
+class PushPopTest(unittest.TestCase):
+    """Exact instructions of the push and pop sequences chosen by segment and index."""
+
+    def translate(self, command: str, segment: str, index: int, cache_top=False) -> list:
+        """Returns the assembly lines written for one push or pop."""
+        output = io.StringIO()
+        code_writer = CodeWriter(output, cache_top=cache_top)
+        code_writer.set_file_name("Main")
+        code_writer.write_push_pop(command, segment, index)
+        return [line for line in output.getvalue().split("\n") if line]
+
+    def test_push_index_zero(self):
+        self.assertEqual(self.translate("C_PUSH", "local", 0),
+                         ["@LCL", "A=M", "D=M", "@SP", "AM=M+1", "A=A-1", "M=D"])
+
+    def test_push_small_index(self):
+        self.assertEqual(self.translate("C_PUSH", "argument", 1),
+                         ["@ARG", "A=M+1", "D=M", "@SP", "AM=M+1", "A=A-1", "M=D"])
+        self.assertEqual(self.translate("C_PUSH", "this", 3),
+                         ["@THIS", "A=M+1", "A=A+1", "A=A+1", "D=M", "@SP", "AM=M+1", "A=A-1", "M=D"])
+
+    def test_push_large_index(self):
+        self.assertEqual(self.translate("C_PUSH", "that", 4),
+                         ["@THAT", "D=M", "@4", "A=D+A", "D=M", "@SP", "AM=M+1", "A=A-1", "M=D"])
+
+    def test_push_temp_and_pointer(self):
+        self.assertEqual(self.translate("C_PUSH", "temp", 2), ["@7", "D=M", "@SP", "AM=M+1", "A=A-1", "M=D"])
+        self.assertEqual(self.translate("C_PUSH", "pointer", 1), ["@4", "D=M", "@SP", "AM=M+1", "A=A-1", "M=D"])
+
+    def test_push_static(self):
+        self.assertEqual(self.translate("C_PUSH", "static", 3), ["@Main.3", "D=M", "@SP", "AM=M+1", "A=A-1", "M=D"])
+
+    def test_push_small_constants(self):
+        for index in [0, 1, -1]:
+            self.assertEqual(self.translate("C_PUSH", "constant", index), ["@SP", "AM=M+1", "A=A-1", "M=" + str(index)])
+            self.assertEqual(self.translate("C_PUSH", "constant", index, cache_top=True), ["D=" + str(index)])
+
+    def test_push_constant(self):
+        self.assertEqual(self.translate("C_PUSH", "constant", 7), ["@7", "D=A", "@SP", "AM=M+1", "A=A-1", "M=D"])
+        self.assertEqual(self.translate("C_PUSH", "constant", 7, cache_top=True), ["@7", "D=A"])
+
+    def test_pop_index_zero(self):
+        self.assertEqual(self.translate("C_POP", "local", 0), ["@SP", "AM=M-1", "D=M", "@LCL", "A=M", "M=D"])
+
+    def test_pop_small_index_skips_r13(self):
+        self.assertEqual(self.translate("C_POP", "that", 2),
+                         ["@SP", "AM=M-1", "D=M", "@THAT", "A=M+1", "A=A+1", "M=D"])
+
+    def test_pop_large_index(self):
+        self.assertEqual(self.translate("C_POP", "local", 8),
+                         ["@8", "D=A", "@LCL", "A=M", "D=D+A", "@R13", "M=D",
+                          "@SP", "AM=M-1", "D=M", "@R13", "A=M", "M=D"])
+
+    def test_pop_temp_pointer_and_static_skip_r13(self):
+        self.assertEqual(self.translate("C_POP", "temp", 0), ["@SP", "AM=M-1", "D=M", "@5", "M=D"])
+        self.assertEqual(self.translate("C_POP", "pointer", 0), ["@SP", "AM=M-1", "D=M", "@3", "M=D"])
+        self.assertEqual(self.translate("C_POP", "static", 1), ["@SP", "AM=M-1", "D=M", "@Main.1", "M=D"])
+
+    def test_cached_push(self):
+        self.assertEqual(self.translate("C_PUSH", "local", 1, cache_top=True), ["@LCL", "A=M+1", "D=M"])
+        self.assertEqual(self.translate("C_PUSH", "local", 4, cache_top=True), ["@LCL", "D=M", "@4", "A=D+A", "D=M"])
+        self.assertEqual(self.translate("C_PUSH", "temp", 1, cache_top=True), ["@6", "D=M"])
+
+    def test_cached_pop(self):
+        # The stack top is not cached yet, so it is popped into D first.
+        self.assertEqual(self.translate("C_POP", "argument", 1, cache_top=True),
+                         ["@SP", "AM=M-1", "D=M", "@ARG", "A=M+1", "M=D"])
+        self.assertEqual(self.translate("C_POP", "argument", 8, cache_top=True),
+                         ["@SP", "AM=M-1", "D=M", "@R13", "M=D", "@ARG", "D=D+M", "@8", "D=D+A",
+                          "@R13", "A=D-M", "M=D-A"])
+        self.assertEqual(self.translate("C_POP", "static", 0, cache_top=True), ["@SP", "AM=M-1", "D=M", "@Main.0", "M=D"])
+
+
+if __name__ == "__main__":
+    unittest.main()